@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class TTLCache:
+    """Small thread-safe in-process cache with per-entry expiry and LRU eviction.
+
+    Used for hot read-through lookups (e.g. workspace access checks) that are safe to
+    serve slightly stale for a few seconds. Each backend process has its own copy, so
+    write endpoints must call invalidate() for the keys they affect.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30.0, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._key_locks = {} # key -> [lock held while that key is being loaded, number of callers using it]
+        self._generation = 0 # Bumped on invalidation so in-flight loads don't store stale values
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default if missing/expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        """Stores value under key for ttl seconds (defaults to the cache TTL)."""
+        with self._lock:
+            self._set_locked(key, value, ttl)
+
+    def _set_locked(self, key, value, ttl: float = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, predicate=None):
+        """Drops entries whose key matches predicate(key), or everything if predicate is None."""
+        with self._lock:
+            self._generation += 1
+            if predicate is None:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def refresh(self, key, loader):
+        """Reloads key with loader() and stores the result, unless the cache was invalidated
+        while loading (the caller still gets the loaded value). Used for background refreshes."""
+        with self._lock:
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._set_locked(key, value)
+        return value
+
+    def get_or_set(self, key, loader):
+        """Returns the cached value for key, calling loader() to fill it on a miss.
+
+        Concurrent misses for the same key are single-flighted: one caller runs the
+        loader while the others wait and then read its result from the cache.
+        Exceptions from loader propagate and nothing is cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            # Reference-counted so the lock is only dropped once no caller waits on or holds it;
+            # otherwise a late caller could create a second lock and load concurrently
+            lock_entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            lock_entry[1] += 1
+        key_lock = lock_entry[0]
+        try:
+            with key_lock:
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                with self._lock:
+                    generation = self._generation
+                value = loader()
+                with self._lock:
+                    # Skip storing if the key was invalidated while we were loading
+                    if generation == self._generation:
+                        self._set_locked(key, value)
+                return value
+        finally:
+            with self._lock:
+                lock_entry[1] -= 1
+                if lock_entry[1] == 0:
+                    del self._key_locks[key]
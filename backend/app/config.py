@@ -0,0 +1,28 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from the root .env file (especially for local dev).
+# Every backend module imports its settings from here, so the file is parsed once per process.
+_DOTENV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
+if os.path.exists(_DOTENV_PATH):
+    load_dotenv(dotenv_path=_DOTENV_PATH)
+    print(f"Loaded environment variables from: {_DOTENV_PATH}")
+else:
+    print(f"Warning: Root .env file not found at {_DOTENV_PATH}, relying on environment.")
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ('true', 'yes', '1')
+
+# --- Execution Mode ---
+IS_LOCAL_DEV = _env_flag("LOCAL_DEV")
+
+# --- GCP / GCS ---
+GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
+GCP_REGION = os.getenv("GCP_REGION")
+GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME") if not IS_LOCAL_DEV else None
+
+# --- Firebase ---
+FIREBASE_CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "./firebase-service-account.json")
+
+# --- Local Storage (used only if IS_LOCAL_DEV is True) ---
+LOCAL_STORAGE_PATH = os.getenv("LOCAL_STORAGE_PATH", os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'local_uploads')))
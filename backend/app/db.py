@@ -1,23 +1,20 @@
 import os
+import re
+import functools
+from urllib.parse import quote
 import psycopg2
+import psycopg2.extras
 from psycopg2 import pool
-from dotenv import load_dotenv
 import logging
 
-# Load environment variables from .env file (especially for local dev)
-# Now expects the .env to be in the parent directory (project root)
-_DOTENV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
-if os.path.exists(_DOTENV_PATH):
-    load_dotenv(dotenv_path=_DOTENV_PATH)
-    print(f"db.py: Loaded environment variables from: {_DOTENV_PATH}")
-else:
-     print(f"db.py: Root .env file not found at {_DOTENV_PATH}, relying on environment.")
+# Environment (.env) is loaded once by app.config
+from . import config
 
 logger = logging.getLogger(__name__)
 
 # --- Configuration (Read AFTER loading .env) --- 
 # Check if running in local development mode via an env var
-IS_LOCAL_DEV = os.getenv("LOCAL_DEV", "false").lower() in ('true', 'yes', '1')
+IS_LOCAL_DEV = config.IS_LOCAL_DEV
 logger.info(f"db.py: IS_LOCAL_DEV={IS_LOCAL_DEV}")
 
 # Cloud SQL specific vars (still load them)
@@ -25,9 +22,54 @@ USE_SOCKET = os.getenv("USE_SOCKET", "false").lower() in ('true', 'yes', '1')
 INSTANCE_CONNECTION_NAME = os.getenv("INSTANCE_CONNECTION_NAME")
 DB_SOCKET_DIR = os.getenv("DB_SOCKET_DIR", "/cloudsql")
 
+# Set when DB_HOST/DB_PORT (or DATABASE_URL) point at PgBouncer in transaction pooling mode
+# (see infra/pgbouncer). Server connections are then shared between clients per transaction,
+# so nothing may rely on session state, and PgBouncer does the real pooling.
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ('true', 'yes', '1')
+
+# Pool sizing - keep DB_POOL_MAX_CONN below the server's max_connections divided by the number of instances.
+# Behind PgBouncer the local pool only needs to cover this process's concurrency.
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "1"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "5" if DB_PGBOUNCER else "10"))
+
+# Named server-side prepared statements (see execute_prepared). PREPARE is session state, so
+# these are off by default behind PgBouncer's transaction pooling.
+DB_USE_PREPARED_STATEMENTS = os.getenv("DB_USE_PREPARED_STATEMENTS", "false" if DB_PGBOUNCER else "true").lower() in ('true', 'yes', '1')
+
 # Initialize pool variable
 db_pool = None
 
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which named statements it has PREPAREd.
+    Prepared statements live for the life of the server session, i.e. of this object."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+_POSITIONAL_PARAM_RE = re.compile(r"\$(\d+)")
+
+def execute_prepared(cur, name: str, sql: str, params=()):
+    """Executes `sql` (written with $1..$n placeholders) as the named prepared statement `name`.
+
+    The statement is PREPAREd once per pooled connection and then only EXECUTEd, so Postgres
+    skips parse/plan on repeat calls. Falls back to a plain execute when prepared statements
+    are disabled or the connection wasn't created by this pool. `sql` must not contain
+    literal '%' characters.
+    """
+    conn = cur.connection
+    prepared = getattr(conn, "prepared_statements", None)
+    if not DB_USE_PREPARED_STATEMENTS or prepared is None:
+        cur.execute(_POSITIONAL_PARAM_RE.sub(r"%(p\1)s", sql),
+                    {f"p{i}": value for i, value in enumerate(params, start=1)})
+        return
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        prepared.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+    else:
+        cur.execute(f"EXECUTE {name}")
+
 def get_connection_params() -> dict:
     """Determines the correct database connection parameters based on mode."""
     params = {
@@ -65,6 +107,25 @@ def get_connection_params() -> dict:
 
     return params
 
+@functools.lru_cache(maxsize=1)
+def get_connection_string() -> str:
+    """Returns the SQLAlchemy/libpq connection URL used by the processing pipeline (PGVector).
+    Built once from the environment and cached for the life of the process."""
+    if IS_LOCAL_DEV:
+        db_user = os.getenv('DB_USER')
+        db_password = os.getenv('DB_PASSWORD')
+        db_host = os.getenv('DB_HOST', 'localhost')
+        db_port = os.getenv('DB_PORT', '5432')
+        db_name = os.getenv('DB_NAME')
+        if not all([db_user, db_password, db_host, db_name]):
+            raise ValueError("Local DB config incomplete (DB_USER, DB_PASSWORD, DB_HOST, DB_NAME)")
+        return f"postgresql://{quote(db_user, safe='')}:{quote(db_password, safe='')}@{db_host}:{db_port}/{db_name}"
+
+    connection_string = os.getenv('DATABASE_URL')
+    if not connection_string:
+        raise ValueError("DATABASE_URL not configured")
+    return connection_string
+
 def init_db_pool():
     """Initializes the database connection pool based on the environment."""
     global db_pool
@@ -73,16 +134,22 @@ def init_db_pool():
         return
         
     try:
+        # Bind uuid.UUID parameters natively (and read uuid columns back as uuid.UUID)
+        # so callers don't need to str() every ID before passing it to a cursor.
+        psycopg2.extras.register_uuid()
+
         conn_params = get_connection_params()
         logger.info(f"Initializing DB pool with params: { {k: v for k, v in conn_params.items() if k != 'password'} }") # Log params except password
         
-        # Create a connection pool using determined parameters
-        db_pool = psycopg2.pool.SimpleConnectionPool(
-            minconn=1,
-            maxconn=10, # Adjust max connections based on expected load
+        # Create a connection pool using determined parameters.
+        # FastAPI runs sync work on a threadpool, so the pool must be thread-safe.
+        db_pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn=DB_POOL_MIN_CONN,
+            maxconn=DB_POOL_MAX_CONN,
+            connection_factory=PreparingConnection,
             **conn_params
         )
-        logger.info(f"Database connection pool created successfully.")
+        logger.info(f"Database connection pool created successfully (min={DB_POOL_MIN_CONN}, max={DB_POOL_MAX_CONN}, pgbouncer={DB_PGBOUNCER}).")
 
     except (Exception, psycopg2.DatabaseError) as error:
         logger.error(f"Error while connecting to PostgreSQL and creating pool: {error}", exc_info=True)
@@ -99,6 +166,11 @@ def get_db_connection():
              raise ConnectionError("Database connection pool is not available after attempting initialization.")
              
     conn = db_pool.getconn()
+    if conn.closed:
+        # Server side went away (restart, PgBouncer recycle, idle timeout) - discard it and take another
+        logger.warning("Discarding closed connection from the DB pool.")
+        db_pool.putconn(conn, close=True)
+        conn = db_pool.getconn()
     try:
         # Setting autocommit to False is generally preferred for web applications
         # where transactions are managed per request.
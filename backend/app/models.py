@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr, validator, root_validator
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, FrozenSet
 import uuid
 from datetime import datetime
 
@@ -67,7 +67,8 @@ class User(BaseModel):
     user_id: str
     email: Optional[EmailStr] = None
     role: Optional[str] = None # e.g., 'admin', 'user'
-    groups: List[str] = [] # List of group names user belongs to
+    is_admin: bool = False # Derived from role once at auth time
+    groups: FrozenSet[str] = frozenset() # Names of the groups the user belongs to
 
 # --- Group Models ---
 
@@ -109,6 +110,28 @@ class UserAdminView(BaseModel):
     role: Optional[str] = None
     groups: List[str] = []
 
+class UserAdminPage(BaseModel):
+    users: List[UserAdminView]
+    next_page_token: Optional[str] = None # Pass back as page_token for the next page; None on the last page
+
 class WorkspaceGroupAccessEntry(BaseModel):
     workspace_id: uuid.UUID
-    group_id: uuid.UUID
\ No newline at end of file
+    group_id: uuid.UUID
+
+
+# --- Query Models ---
+
+class QueryRequest(BaseModel):
+    query: str = Field(..., min_length=1, description="The question to answer.")
+    workspace_id: uuid.UUID
+    embedding_model: Optional[str] = Field(None, description="Overrides the workspace's embedding model.")
+    top_k: Optional[int] = Field(None, gt=0, le=100, description="Overrides the workspace's Top K (max 100).")
+    model: Optional[str] = Field(None, description="LLM model name. Defaults to the server's configured model.")
+    chat_history: List[Dict[str, Any]] = Field(default_factory=list, description="Previous messages, oldest first.")
+    temperature: float = Field(0.2, ge=0.0, le=2.0)
+
+    @validator("query")
+    def query_not_blank(cls, value):
+        if not value.strip():
+            raise ValueError("Query text is required")
+        return value
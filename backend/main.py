@@ -4,33 +4,40 @@
 import logging
 import os
 import uuid
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 from typing import List, Dict, Optional, Any
 import datetime
-import mimetypes
 import sys # Added for path manipulation
-import subprocess # Added for local processing trigger
+import concurrent.futures
+import multiprocessing
+import importlib
+import time
+import queue
+import logging.handlers
 import shutil # Added for local file saving
-from dotenv import load_dotenv # Added for .env loading
 import json # Add this import at the top with other imports
+import hashlib # Used for admin list ETags
+import base64
+import threading
+import functools
+try:
+    import orjson # Optional: much faster JSON encoding for streamed debug payloads
+except ImportError:
+    orjson = None
 
 # --- Load Environment Variables FIRST ---
-# Construct the path to the root .env file (assuming backend is one level down)
-_DOTENV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.env'))
-if os.path.exists(_DOTENV_PATH):
-    load_dotenv(dotenv_path=_DOTENV_PATH)
-    print(f"Loaded environment variables from: {_DOTENV_PATH}")
-else:
-    print(f"Warning: Root .env file not found at {_DOTENV_PATH}")
+# app.config parses the root .env once and exposes the settings shared by all backend modules
+from app import config
  
 # Determine execution mode
-IS_LOCAL_DEV = os.getenv("LOCAL_DEV", "false").lower() == "true"
+IS_LOCAL_DEV = config.IS_LOCAL_DEV
 print(f"--- Running in LOCAL_DEV mode: {IS_LOCAL_DEV} ---")
 
 # --- FastAPI Imports ---
-from fastapi import FastAPI, Depends, HTTPException, status, Path, Query, File, UploadFile, Form, Body, Response # Added Response
+from fastapi import FastAPI, Depends, HTTPException, status, Path, Query, File, UploadFile, Form, Body, Response, Request, BackgroundTasks # Added Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 import asyncio # Import asyncio for the stream generator
  
 # --- Database Imports ---
@@ -44,26 +51,45 @@ from psycopg2 import pool # Although pool is used in db.py, importing here can b
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Conditionally import storage client
-if not IS_LOCAL_DEV:
-    try:
-        from google.cloud import storage
-        from google.api_core import exceptions as google_exceptions
-    except ImportError:
-        storage = None # Set to None if not installed or not needed
-        google_exceptions = None
-        print("Note: google-cloud-storage not imported (or not installed). GCS features disabled.")
-else:
-    storage = None # Not needed for local dev
-    google_exceptions = None
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that enqueues the record untouched. The stock prepare() formats the
+    message and traceback in the calling thread, which is exactly the work we want off the
+    event loop; records stay in-process, so they don't need to be made picklable."""
+    def prepare(self, record):
+        return record
+
+def _start_log_listener() -> tuple:
+    """Moves the root handlers behind a queue so formatting and stderr writes happen on a
+    background thread instead of in request handlers/stream generators.
+    Returns (listener, queue_handler) for _stop_log_listener."""
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener, queue_handler
+
+def _stop_log_listener(listener: logging.handlers.QueueListener, queue_handler: logging.Handler):
+    """Flushes queued records and puts the original root handlers back, so logging keeps
+    working (synchronously) outside the app's lifespan and a later startup can move them again."""
+    listener.stop()
+    root = logging.getLogger()
+    root.removeHandler(queue_handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
 
 # --- Local Application Imports ---
-from app import models, db # Your local models and db connection utility
+from app import models, db, cache # Your local models, db connection utility and in-process caches
 from app.models import WorkspaceConfigUpdate # Import the new model
 
-# --- Firebase Imports ---
-import firebase_admin
-from firebase_admin import credentials, auth
+# --- Heavy Imports ---
+# firebase_admin, google-cloud-storage and the processing pipeline (LangChain/Vertex AI) are
+# imported on first use by get_firebase_auth, get_gcs_client and get_query_stream_function,
+# which keeps them out of cold start and worker memory until a request needs them.
 
 # --- Processing Pipeline Imports ---
 # Add processing directory to sys.path to allow imports
@@ -75,27 +101,25 @@ if _PROJECT_ROOT not in sys.path:
     sys.path.insert(0, _PROJECT_ROOT)
     logger.info(f"Added project root to sys.path: {_PROJECT_ROOT}")
 
-try:
-    # Corrected import path relative to project root
-    from processing.query.main import process_query, process_query_stream 
-    logger.info("Successfully imported process_query and process_query_stream from processing.query.main")
-except ImportError as e:
-    logger.error(f"Could not import process_query or process_query_stream: {e}. Query endpoint will likely fail.", exc_info=True)
-    process_query = None # Define as None if import fails
-    process_query_stream = None
-except ModuleNotFoundError as e:
-     logger.error(f"Could not find processing module: {e}. Ensure structure is correct and processing is in PYTHONPATH.", exc_info=True)
-     process_query = None
-     process_query_stream = None
+@functools.lru_cache(maxsize=1)
+def get_query_stream_function():
+    """Imports the processing pipeline on first use and returns process_query_stream, or None if unavailable."""
+    try:
+        # Corrected import path relative to project root
+        from processing.query.main import process_query_stream
+        logger.info("Successfully imported process_query_stream from processing.query.main")
+        return process_query_stream
+    except ImportError as e: # Includes ModuleNotFoundError
+        logger.error(f"Could not import process_query_stream: {e}. Ensure processing is in PYTHONPATH. Query endpoint will fail.", exc_info=True)
+        return None
 
 
 # --- Load GCS/GCP Config (Only if not in local dev mode) ---
-GCS_BUCKET_NAME = None
-GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
-GCP_REGION = os.getenv("GCP_REGION")
+GCS_BUCKET_NAME = config.GCS_BUCKET_NAME
+GCP_PROJECT_ID = config.GCP_PROJECT_ID
+GCP_REGION = config.GCP_REGION
 
 if not IS_LOCAL_DEV:
-    GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
     if not GCS_BUCKET_NAME:
         logger.warning("GCS_BUCKET_NAME environment variable is not set. GCS uploads will fail.")
     else:
@@ -109,16 +133,103 @@ if GCP_REGION:
     logger.info(f"GCP Region: {GCP_REGION}")
 
 # Define Local Storage Path (used only if IS_LOCAL_DEV is True)
-LOCAL_STORAGE_PATH = os.getenv("LOCAL_STORAGE_PATH", os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'local_uploads')))
+LOCAL_STORAGE_PATH = config.LOCAL_STORAGE_PATH
 if IS_LOCAL_DEV:
     logger.info(f"Local file storage path: {LOCAL_STORAGE_PATH}")
     os.makedirs(LOCAL_STORAGE_PATH, exist_ok=True)
 
+# --- Application Lifespan ---
+def _init_db_pool_on_startup():
+    """Initializes the DB pool, logging (not raising) failures; get_db_connection retries lazily."""
+    try:
+        db.init_db_pool() # Initialize the pool using loaded env vars and IS_LOCAL_DEV flag
+        logger.info("Database pool initialized.")
+        # Build (and cache) the pipeline's connection URL now so a misconfiguration shows up at boot
+        db.get_connection_string()
+    except ValueError as e:
+        logger.error(f"FATAL: Database configuration error: {e}. Application might not function correctly.")
+    except Exception as e:
+        logger.error(f"FATAL: Failed to initialize database pool: {e}", exc_info=True)
+
+def _check_gcs_client_on_startup():
+    """Creates the GCS client up front so the first upload doesn't pay for it."""
+    try:
+        get_gcs_client() # Attempt to initialize
+        logger.info("GCS client check successful (or initialization attempted).")
+    except HTTPException as e:
+        logger.error(f"Failed GCS client initialization check during startup: {e.detail}")
+    except Exception as e:
+        logger.error(f"Unexpected error during GCS client check: {e}", exc_info=True)
+
+def _prewarm_firebase_on_startup():
+    """Initializes the Firebase SDK and fetches Google's ID-token signing certs up front, so the
+    first authenticated request doesn't pay for the import and the HTTPS fetch."""
+    try:
+        firebase_auth = get_firebase_auth()
+        import firebase_admin
+        project_id = firebase_admin.get_app().project_id
+        # Verifying a well-formed but unsigned token goes through the public API all the way to the
+        # signature check, which downloads the signing certs into the SDK's HTTP cache - real
+        # verifications are then served from that cache until the certs' max-age runs out.
+        # The verification itself is expected to fail.
+        warmup_token = "x.x.x"
+        if project_id:
+            encode = lambda part: base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b"=").decode()
+            warmup_token = ".".join([
+                encode({"alg": "RS256", "kid": "prewarm", "typ": "JWT"}),
+                encode({"aud": project_id, "iss": f"https://securetoken.google.com/{project_id}", "sub": "prewarm"}),
+                "x"
+            ])
+        try:
+            firebase_auth.verify_id_token(warmup_token)
+        except (firebase_auth.InvalidIdTokenError, ValueError):
+            pass
+        logger.info("Firebase ID token verification pre-warmed.")
+    except Exception as e:
+        logger.warning(f"Could not pre-warm Firebase token verification: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Sets up shared resources before serving and releases them on shutdown."""
+    app.state.log_listener, app.state.log_queue_handler = _start_log_listener()
+    logger.info("Application startup: Initializing resources...")
+    # The DB handshake, Firebase cert fetch and GCS credential exchange are independent network round trips - overlap them
+    startup_tasks = [asyncio.to_thread(_init_db_pool_on_startup), asyncio.to_thread(_prewarm_firebase_on_startup)]
+    if not IS_LOCAL_DEV:
+        startup_tasks.append(asyncio.to_thread(_check_gcs_client_on_startup))
+    else:
+        logger.info("Skipping GCS client check in LOCAL_DEV mode.")
+    await asyncio.gather(*startup_tasks)
+    purge_task = asyncio.create_task(_workspace_purge_loop())
+    app.state.proc_pool = None
+    if IS_LOCAL_DEV:
+        # Warm workers that import the processing pipeline once and then take uploads back-to-back.
+        # "spawn" keeps the workers clear of this process's threads and open DB connections.
+        app.state.proc_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=LOCAL_PROCESSING_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=importlib.import_module,
+            initargs=("processing.main",)
+        )
+        logger.info(f"Local processing pool started with {LOCAL_PROCESSING_WORKERS} workers.")
+
+    yield
+
+    logger.info("Application shutdown: Cleaning up resources...")
+    purge_task.cancel()
+    if app.state.proc_pool is not None:
+        app.state.proc_pool.shutdown(wait=False, cancel_futures=True)
+    db.close_db_pool()
+    _stop_log_listener(app.state.log_listener, app.state.log_queue_handler) # Flushes any queued log records
+
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="RAG System Backend",
     description="API for managing workspaces, documents, uploads, and queries for the RAG system.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
+    # orjson renders large lists (e.g. workspace pages, user lists) several times faster than stdlib json
+    default_response_class=ORJSONResponse if orjson else JSONResponse
 )
 
 # --- Define API Tags for Endpoints ---
@@ -129,33 +240,44 @@ tags_admin = ["Admin Management"]
 tags_queries = ["Queries"]
 tags_general = ["General"]
 
-# --- Database Initialization (Crucial - after env load) ---
-try:
-    db.init_db_pool() # Initialize the pool using loaded env vars and IS_LOCAL_DEV flag
-except ValueError as e:
-     logger.error(f"FATAL: Database configuration error: {e}. Application might not function correctly.")
-     # Decide if you want to exit or let it fail later
-except Exception as e:
-    logger.error(f"FATAL: Failed to initialize database pool: {e}", exc_info=True)
-    # Decide if you want to exit
-
 # --- Dependencies ---
 
 # Create a reusable bearer token auth dependency
 security = HTTPBearer()
 
+# Verified tokens -> models.User, keyed by a hash of the token (the raw token is never stored).
+# Entries never outlive the token's own `exp`, so caching can't extend a token's validity.
+AUTH_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "60"))
+AUTH_TOKEN_CACHE_MAXSIZE = int(os.getenv("AUTH_TOKEN_CACHE_MAXSIZE", "50000"))
+_token_cache = cache.TTLCache(maxsize=AUTH_TOKEN_CACHE_MAXSIZE, ttl=AUTH_TOKEN_CACHE_TTL_SECONDS, name="auth_tokens")
+
+def _verify_id_token(token: str) -> dict:
+    """Blocking: loads the Firebase SDK if needed, then checks the token signature and claims."""
+    return get_firebase_auth().verify_id_token(token, clock_skew_seconds=10)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verify Firebase ID token and return user details including custom claims."""
     token = credentials.credentials
+    token_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached_user = _token_cache.get(token_key)
+    if cached_user is not None:
+        return cached_user
+
     logger.info(f"Attempting to verify token: {token[:10]}...") # Log start and part of token
     try:
-        decoded_token = auth.verify_id_token(token, clock_skew_seconds=10)
+        # RSA verification (and the occasional public-key fetch) is blocking - keep it off the event loop
+        decoded_token = await run_in_threadpool(_verify_id_token, token)
         user_id = decoded_token['uid']
         email = decoded_token.get('email')
         role = decoded_token.get('role')
         groups = decoded_token.get('groups', [])
         logger.info(f"Token verified successfully for user: {user_id}, Role: {role}") # Log success
-        return models.User(user_id=user_id, email=email, role=role, groups=groups)
+        user = models.User(user_id=user_id, email=email, role=role,
+                           is_admin=(role or "").lower() == "admin", groups=frozenset(groups))
+        ttl = min(AUTH_TOKEN_CACHE_TTL_SECONDS, decoded_token.get('exp', 0) - time.time())
+        if ttl > 0:
+            _token_cache.set(token_key, user, ttl=ttl)
+        return user
     except Exception as e:
         logger.error(f"Token verification failed: {e}", exc_info=True) # Log the specific error
         raise HTTPException(
@@ -189,10 +311,101 @@ def get_db_session():
         if conn:
             db.release_db_connection(conn)
 
+@contextmanager
+def get_db_session_ro():
+    """Like get_db_session, for endpoints that only SELECT. The connection runs in autocommit
+    mode, so psycopg2 sends no BEGIN before the first query and there's no COMMIT at the end -
+    two fewer round trips. Each statement sees its own snapshot, so use get_db_session where
+    several reads must be consistent with each other."""
+    conn = None
+    try:
+        conn = db.get_db_connection()
+        # Client-side switch only (nothing is sent to the server); get_db_connection turns it
+        # back off when the connection is next checked out
+        conn.autocommit = True
+        yield conn
+    except (Exception, psycopg2.Error) as error:
+        if isinstance(error, HTTPException):
+             raise error
+        logger.error(f"Database error occurred: {error}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database operation failed")
+    finally:
+        if conn:
+            db.release_db_connection(conn)
+
+# --- In-Process Caches ---
+# (user_id, workspace_id) -> workspace config dict for the query endpoint, or None if no access.
+# Per process only: endpoints that change access or config must invalidate the affected keys.
+QUERY_ACCESS_CACHE_TTL_SECONDS = float(os.getenv("QUERY_ACCESS_CACHE_TTL_SECONDS", "30"))
+workspace_access_cache = cache.TTLCache(maxsize=10_000, ttl=QUERY_ACCESS_CACHE_TTL_SECONDS, name="workspace_access")
+
+def invalidate_workspace_access(workspace_id: Optional[uuid.UUID] = None, user_id: Optional[str] = None):
+    """Drops cached access entries for a workspace and/or user (everything if neither is given)."""
+    if workspace_id is None and user_id is None:
+        workspace_access_cache.invalidate()
+        return
+    workspace_access_cache.invalidate(
+        lambda key: (workspace_id is not None and key[1] == workspace_id)
+                    or (user_id is not None and key[0] == user_id)
+    )
+
+# user_id -> tuple of group_ids the user belongs to, used by the workspace list/get queries.
+USER_GROUPS_CACHE_TTL_SECONDS = float(os.getenv("USER_GROUPS_CACHE_TTL_SECONDS", "60"))
+user_groups_cache = cache.TTLCache(maxsize=5_000, ttl=USER_GROUPS_CACHE_TTL_SECONDS, name="user_groups")
+
+def get_user_group_ids(user_id: str) -> List[uuid.UUID]:
+    """Blocking: returns the IDs of the groups user_id belongs to (cached per process)."""
+    def load():
+        with get_db_session_ro() as conn:
+            with conn.cursor() as cur:
+                db.execute_prepared(cur, "user_group_ids",
+                                    "SELECT group_id FROM user_group_memberships WHERE user_id = $1", (user_id,))
+                return tuple(row[0] for row in cur)
+    # Cached as a tuple so callers can't mutate it; psycopg2 adapts lists (not tuples) to arrays
+    return list(user_groups_cache.get_or_set(user_id, load))
+
+def invalidate_user_groups(user_id: Optional[str] = None):
+    """Drops cached group memberships for a user (everyone if user_id is None)."""
+    if user_id is None:
+        user_groups_cache.invalidate()
+    else:
+        user_groups_cache.invalidate(lambda key: key == user_id)
+
+# group_name -> group_id for every group, used to validate group assignments without a query.
+# Groups change far less often than assignments; a name missing from the cache triggers one reload.
+GROUPS_CACHE_TTL_SECONDS = float(os.getenv("GROUPS_CACHE_TTL_SECONDS", "30"))
+groups_cache = cache.TTLCache(maxsize=1, ttl=GROUPS_CACHE_TTL_SECONDS, name="groups")
+
+def get_group_ids_by_name() -> Dict[str, uuid.UUID]:
+    """Blocking: returns {group_name: group_id} for all groups (cached per process)."""
+    def load():
+        with get_db_session_ro() as conn:
+            with conn.cursor() as cur:
+                db.execute_prepared(cur, "group_ids_by_name", "SELECT group_name, group_id FROM user_groups")
+                return {name: group_id for name, group_id in cur}
+    return groups_cache.get_or_set("all", load)
+
+def resolve_group_names(group_names: List[str]) -> Dict[str, uuid.UUID]:
+    """Blocking: maps group names to IDs, raising 400 for names that don't exist.
+    Reloads the cached group table once if a name is missing, so freshly created groups resolve."""
+    groups = get_group_ids_by_name()
+    if any(name not in groups for name in group_names):
+        invalidate_groups()
+        groups = get_group_ids_by_name()
+    missing_names = {name for name in group_names if name not in groups}
+    if missing_names:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Invalid group names provided: {', '.join(missing_names)}")
+    return {name: groups[name] for name in group_names}
+
+def invalidate_groups():
+    """Drops the cached group table (after a group is created or deleted)."""
+    groups_cache.invalidate()
+
 # --- Helper Function for Admin Check ---
 def require_admin(current_user: models.User = Depends(get_current_user)):
     """Dependency that raises HTTP 403 if the user is not an admin."""
-    if not current_user.role or current_user.role.lower() != 'admin':
+    if not current_user.is_admin:
         logger.warning(f"Forbidden: Non-admin user {current_user.user_id} attempted admin action.")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -202,6 +415,19 @@ def require_admin(current_user: models.User = Depends(get_current_user)):
 
 # Google Cloud Storage Client Dependency (Conditional)
 _gcs_client = None
+# Keep-alive HTTPS connections the shared GCS client holds. Concurrent uploads beyond the pool size
+# would otherwise open (and then discard) extra connections, each paying a fresh TLS handshake.
+GCS_HTTP_POOL_SIZE = int(os.getenv("GCS_HTTP_POOL_SIZE", "32"))
+
+def _enlarge_gcs_connection_pool(client):
+    """Replaces the client's default 10-connection HTTPS pool with one sized for concurrent uploads."""
+    try:
+        import requests
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=GCS_HTTP_POOL_SIZE)
+        client._http.mount("https://", adapter)
+    except Exception as e:
+        logger.warning(f"Could not resize the GCS connection pool, using the default: {e}")
+
 def get_gcs_client():
     """Dependency function to get a GCS client instance (singleton pattern). Returns None if in local dev."""
     if IS_LOCAL_DEV:
@@ -209,13 +435,17 @@ def get_gcs_client():
         
     global _gcs_client
     if _gcs_client is None:
-        if storage is None:
+        try:
+            from google.cloud import storage
+        except ImportError:
              logger.error("Attempted to get GCS client, but google-cloud-storage is not available.")
              raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                  detail="Cloud Storage client not available.")
         try:
             logger.info("Initializing Google Cloud Storage client...")
-            _gcs_client = storage.Client(project=GCP_PROJECT_ID)
+            client = storage.Client(project=GCP_PROJECT_ID)
+            _enlarge_gcs_connection_pool(client)
+            _gcs_client = client
             logger.info("Google Cloud Storage client initialized successfully.")
         except Exception as e:
             logger.error(f"Failed to initialize Google Cloud Storage client: {e}", exc_info=True)
@@ -223,109 +453,96 @@ def get_gcs_client():
                                 detail="Could not connect to Cloud Storage service.")
     return _gcs_client
 
-# Initialize Firebase Admin SDK
-# Check if Firebase app is already initialized to avoid multiple initializations
-if not firebase_admin._apps:
-    firebase_cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "./firebase-service-account.json") # Use env var or default path
-    try:
-        if os.path.exists(firebase_cred_path):
-            firebase_cred = credentials.Certificate(firebase_cred_path)
-            # Get project ID from environment
-            project_id = os.getenv("GCP_PROJECT_ID")
-            if not project_id:
-                logger.warning("GCP_PROJECT_ID not set in environment variables")
-            # Initialize with both credentials and project ID
-            firebase_admin.initialize_app(firebase_cred, {'projectId': project_id})
-            logger.info(f"Firebase Admin SDK initialized with service account: {firebase_cred_path} and project ID: {project_id}")
-        else:
-             logger.warning(f"Firebase service account key not found at {firebase_cred_path}. Trying default credentials.")
-             # Get project ID from environment
-             project_id = os.getenv("GCP_PROJECT_ID")
-             if not project_id:
-                 logger.warning("GCP_PROJECT_ID not set in environment variables")
-             # Initialize with project ID
-             firebase_admin.initialize_app(options={'projectId': project_id})
-             logger.info("Firebase Admin SDK initialized with default credentials and project ID: {project_id}")
-    except Exception as e:
-         logger.warning(f"Failed to initialize Firebase with explicit credentials at {firebase_cred_path}: {e}. Falling back to default credentials.")
-         try:
-             # Get project ID from environment
-             project_id = os.getenv("GCP_PROJECT_ID")
-             if not project_id:
-                 logger.warning("GCP_PROJECT_ID not set in environment variables")
-             # Initialize with project ID
-             firebase_admin.initialize_app(options={'projectId': project_id})
-             logger.info("Firebase Admin SDK initialized with default credentials and project ID: {project_id}")
-         except Exception as default_e:
-              logger.error(f"FATAL: Failed to initialize Firebase Admin SDK with both explicit and default credentials: {default_e}")
-              # Depending on criticality, you might raise an error here to stop startup
-
-
-
-# --- Helper Function for Admin Check ---
-def require_admin(current_user: models.User = Depends(get_current_user)):
-    """Dependency that raises HTTP 403 if the user is not an admin."""
-    if not current_user.role or current_user.role.lower() != 'admin':
-        logger.warning(f"Forbidden: Non-admin user {current_user.user_id} attempted admin action.")
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Admin privileges required for this action."
-        )
-    return current_user
-
-# --- Application Lifespan Events ---
-@app.on_event("startup")
-async def startup_event():
-    """Tasks to run when the application starts."""
-    logger.info("Application startup: Verifying resources...")
-    # Database pool check is implicitly done by init_db_pool() earlier
-    if db.db_pool is None:
-         logger.error("Database pool failed to initialize during startup!")
-         # Potentially raise error to prevent startup
-    else:
-         logger.info("Database pool initialized.")
-
-    # GCS client check (only if not local dev)
-    if not IS_LOCAL_DEV:
+# Firebase Admin SDK (imported and initialized on first use)
+@functools.lru_cache(maxsize=1)
+def get_firebase_auth():
+    """Returns the firebase_admin.auth module, initializing the Admin SDK on the first call."""
+    import firebase_admin
+    from firebase_admin import auth
+    _init_firebase(firebase_admin)
+    return auth
+
+def _init_firebase(firebase_admin):
+    """Initializes the Firebase Admin SDK once: service account key if present, else default credentials."""
+    from firebase_admin import credentials
+    # Check if Firebase app is already initialized to avoid multiple initializations
+    if firebase_admin._apps:
+        return
+    project_id = GCP_PROJECT_ID
+    if not project_id:
+        logger.warning("GCP_PROJECT_ID not set in environment variables")
+    firebase_options = {'projectId': project_id}
+
+    firebase_cred_path = config.FIREBASE_CREDENTIALS_PATH
+    if os.path.exists(firebase_cred_path):
         try:
-            get_gcs_client() # Attempt to initialize
-            logger.info("GCS client check successful (or initialization attempted).")
-        except HTTPException as e:
-            logger.error(f"Failed GCS client initialization check during startup: {e.detail}")
+            firebase_admin.initialize_app(credentials.Certificate(firebase_cred_path), firebase_options)
+            logger.info(f"Firebase Admin SDK initialized with service account: {firebase_cred_path} and project ID: {project_id}")
+            return
         except Exception as e:
-             logger.error(f"Unexpected error during GCS client check: {e}", exc_info=True)
+            logger.warning(f"Failed to initialize Firebase with explicit credentials at {firebase_cred_path}: {e}. Falling back to default credentials.")
     else:
-         logger.info("Skipping GCS client check in LOCAL_DEV mode.")
+        logger.warning(f"Firebase service account key not found at {firebase_cred_path}. Trying default credentials.")
 
-@app.on_event("shutdown")
-def shutdown_event():
-    """Tasks to run when the application shuts down."""
-    logger.info("Application shutdown: Cleaning up resources...")
-    db.close_db_pool()
-
-# --- Helper to Get Workspace Config --- 
-# (You might already have this or similar logic)
-def get_workspace_config_from_db(workspace_id: uuid.UUID, db_conn) -> Optional[Dict]:
-    """Fetches workspace config from the database."""
-    query = """
-        SELECT workspace_id, name, owner_user_id, created_at, 
-               config_chunking_method, config_chunk_size, config_chunk_overlap, 
-               config_similarity_metric, config_top_k, config_hybrid_search, config_embedding_model
-        FROM workspaces WHERE workspace_id = %s
-    """
     try:
-        with db_conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute(query, (str(workspace_id),))  # Convert UUID to string here
-            result = cur.fetchone()
-            if result:
-                # Convert to dict
-                return dict(result)
-            else:
-                 logger.warning(f"Workspace config not found in DB for ID: {workspace_id}")
-                 return None
-    except Exception as e:
-        logger.error(f"Error fetching workspace config for {workspace_id}: {e}", exc_info=True)
-        return None
+        firebase_admin.initialize_app(options=firebase_options)
+        logger.info(f"Firebase Admin SDK initialized with default credentials and project ID: {project_id}")
+    except Exception as default_e:
+        logger.error(f"FATAL: Failed to initialize Firebase Admin SDK with both explicit and default credentials: {default_e}")
+        # Depending on criticality, you might raise an error here to stop startup
+
+
+# --- Workspace SQL ---
+# Run as named prepared statements (db.execute_prepared), hence the $n placeholders. Each pooled
+# connection parses/plans these once; the admin and user variants differ only in the access predicate.
+WORKSPACE_COLUMNS = """
+    w.workspace_id, w.name, w.owner_user_id, w.created_at,
+    w.config_chunking_method, w.config_chunk_size,
+    w.config_chunk_overlap, w.config_similarity_metric,
+    w.config_top_k, w.config_hybrid_search, w.config_embedding_model
+"""
+
+# $1 is the user's ID and $2 their group IDs (see get_user_group_ids), so Postgres only
+# probes workspace_group_access instead of joining through user_group_memberships.
+WORKSPACE_USER_ACCESS_PREDICATE = """
+    (w.owner_user_id = $1 OR EXISTS (
+        SELECT 1
+        FROM workspace_group_access wga
+        WHERE wga.workspace_id = w.workspace_id AND wga.group_id = ANY($2::uuid[])))
+"""
+
+# Workspaces marked for deletion (see delete_workspace) are hidden everywhere while they're purged
+WORKSPACE_NOT_PENDING_DELETION = """
+    NOT EXISTS (SELECT 1 FROM workspaces_pending_deletion p WHERE p.workspace_id = w.workspace_id)
+"""
+
+WORKSPACE_LIST_ADMIN_SQL = f"""
+    SELECT {WORKSPACE_COLUMNS}
+    FROM workspaces w
+    WHERE {WORKSPACE_NOT_PENDING_DELETION}
+    ORDER BY w.created_at DESC
+    LIMIT $1 OFFSET $2
+"""
+
+WORKSPACE_LIST_USER_SQL = f"""
+    SELECT {WORKSPACE_COLUMNS}
+    FROM workspaces w
+    WHERE {WORKSPACE_USER_ACCESS_PREDICATE} AND {WORKSPACE_NOT_PENDING_DELETION}
+    ORDER BY w.created_at DESC
+    LIMIT $3 OFFSET $4
+"""
+
+WORKSPACE_GET_ADMIN_SQL = f"""
+    SELECT {WORKSPACE_COLUMNS}
+    FROM workspaces w
+    WHERE w.workspace_id = $1 AND {WORKSPACE_NOT_PENDING_DELETION}
+"""
+
+WORKSPACE_GET_USER_SQL = f"""
+    SELECT {WORKSPACE_COLUMNS}
+    FROM workspaces w
+    WHERE w.workspace_id = $3 AND {WORKSPACE_USER_ACCESS_PREDICATE} AND {WORKSPACE_NOT_PENDING_DELETION}
+"""
 
 # --- API Endpoints ---
 
@@ -336,25 +553,18 @@ async def read_root():
     return {"message": "RAG Backend API is running!"}
 
 # --- Workspace Endpoints ---
+# These are plain `def` endpoints: FastAPI runs them in its threadpool, so the blocking
+# psycopg2 calls don't stall the event loop (and other requests' streams).
 @app.post("/api/workspaces",
           response_model=models.WorkspaceResponse,
           status_code=status.HTTP_201_CREATED,
           tags=tags_workspaces,
           summary="Create a new workspace")
-async def create_workspace(
+def create_workspace(
     workspace_data: models.WorkspaceCreate,
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(require_admin)
 ):
     """Creates a new workspace entry in the database. Requires admin role."""
-    # --- Role Check --- 
-    if not current_user.role or current_user.role.lower() != 'admin':
-        logger.warning(f"Forbidden: User {current_user.user_id} (Role: {current_user.role}) attempted to create workspace.")
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User does not have permission to create workspaces."
-        )
-    # --- End Role Check ---
-    
     owner_user_id = current_user.user_id  # Use the authenticated user's ID
 
     query = """
@@ -370,18 +580,16 @@ async def create_workspace(
 
     try:
         with get_db_session() as conn:
-            with conn.cursor() as cur:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute(query, values)
-                result = cur.fetchone()
-                if not result:
+                created_workspace = cur.fetchone()
+                if not created_workspace:
                     raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                         detail="Failed to create workspace, no data returned.")
-                # Convert row to dict using column names from cursor description
-                created_workspace = dict(zip([desc[0] for desc in cur.description], result))
-                logger.info(f"Workspace created successfully by admin {current_user.user_id}: {created_workspace['workspace_id']}")
-                return models.WorkspaceResponse(**created_workspace) # Validate and return
+                logger.info("Workspace created successfully by admin %s: %s", current_user.user_id, created_workspace['workspace_id'])
+                return models.WorkspaceResponse.model_validate(created_workspace) # Validate and return
     except psycopg2.errors.UniqueViolation:
-         logger.warning(f"Attempted to create workspace with non-unique attribute for user {owner_user_id}.")
+         logger.warning("Attempted to create workspace with non-unique attribute for user %s.", owner_user_id)
          raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                              detail="Workspace with this name might already exist for this user.")
     # Note: HTTPException and general Exception handling is covered by get_db_session context manager
@@ -390,7 +598,7 @@ async def create_workspace(
          response_model=List[models.WorkspaceResponse],
          tags=tags_workspaces, 
          summary="List workspaces")
-async def list_workspaces(
+def list_workspaces(
     current_user: models.User = Depends(get_current_user),
     skip: int = Query(0, ge=0, description="Number of workspaces to skip for pagination"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of workspaces to return")
@@ -400,56 +608,25 @@ async def list_workspaces(
     - Admins see all workspaces.
     - Non-admins see workspaces they own or have access to via group membership.
     """
-    workspaces = []
-    
-    # Base query structure
-    base_query = """
-        SELECT w.workspace_id, w.name, w.owner_user_id, w.created_at,
-               w.config_chunking_method, w.config_chunk_size,
-               w.config_chunk_overlap, w.config_similarity_metric,
-               w.config_top_k, w.config_hybrid_search, w.config_embedding_model
-        FROM workspaces w
-    """
-    
     # Filter based on role
-    if current_user.role and current_user.role.lower() == 'admin':
-        logger.info(f"Admin user {current_user.user_id} listing all workspaces.")
-        query = f"{base_query} ORDER BY w.created_at DESC LIMIT %s OFFSET %s;"
-        values = (limit, skip)
+    if current_user.is_admin:
+        logger.info("Admin user %s listing all workspaces.", current_user.user_id)
+        statement, query, values = "ws_list_admin", WORKSPACE_LIST_ADMIN_SQL, (limit, skip)
     else:
-        logger.info(f"User {current_user.user_id} listing workspaces they can access.")
+        logger.info("User %s listing workspaces they can access.", current_user.user_id)
         # Include workspaces the user owns OR has access to via group membership
-        query = f"""
-            {base_query} 
-            WHERE w.owner_user_id = %s 
-            OR w.workspace_id IN (
-                SELECT wga.workspace_id 
-                FROM workspace_group_access wga
-                WHERE wga.group_id IN (
-                    SELECT ugm.group_id 
-                    FROM user_group_memberships ugm 
-                    WHERE ugm.user_id = %s
-                )
-            )
-            ORDER BY w.created_at DESC 
-            LIMIT %s OFFSET %s;
-        """
-        values = (current_user.user_id, current_user.user_id, limit, skip)
+        group_ids = get_user_group_ids(current_user.user_id)
+        statement, query, values = "ws_list_user", WORKSPACE_LIST_USER_SQL, (current_user.user_id, group_ids, limit, skip)
 
     try:
-        with get_db_session() as conn:
-            with conn.cursor() as cur:
-                logger.debug(f"Executing list workspaces query: {cur.mogrify(query, values).decode()}")
-                cur.execute(query, values)
-                results = cur.fetchall()
-                if results:
-                    column_names = [desc[0] for desc in cur.description]
-                    for row in results:
-                        workspaces.append(dict(zip(column_names, row)))
-        # Use list comprehension for Pydantic validation (more concise)
-        return [models.WorkspaceResponse(**ws) for ws in workspaces]
+        with get_db_session_ro() as conn:
+            # RealDictCursor rows are already dicts keyed by column name
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                logger.debug("Executing list workspaces statement %s with %s", statement, values)
+                db.execute_prepared(cur, statement, query, values)
+                return [models.WorkspaceResponse.model_validate(row) for row in cur]
     except Exception as e: # Catch potential errors before context manager does
-        logger.error(f"Unexpected error listing workspaces: {e}", exc_info=True)
+        logger.error("Unexpected error listing workspaces: %s", e, exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to retrieve workspaces.")
 
@@ -458,7 +635,7 @@ async def list_workspaces(
          response_model=models.WorkspaceResponse,
          tags=tags_workspaces,
          summary="Get a specific workspace by ID")
-async def get_workspace(
+def get_workspace(
     workspace_id: uuid.UUID = Path(..., description="The UUID of the workspace to retrieve"),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -467,77 +644,67 @@ async def get_workspace(
     - Admins can retrieve any workspace.
     - Non-admins can retrieve workspaces they own or have access to via group membership.
     """
-    workspace_id_str = str(workspace_id) # Convert UUID to string for psycopg2
-    
-    # Base query structure
-    base_query = """
-        SELECT w.workspace_id, w.name, w.owner_user_id, w.created_at,
-               w.config_chunking_method, w.config_chunk_size,
-               w.config_chunk_overlap, w.config_similarity_metric,
-               w.config_top_k, w.config_hybrid_search, w.config_embedding_model
-        FROM workspaces w
-        WHERE w.workspace_id = %s
-    """
+    workspace_id_str = str(workspace_id)
     
-    # Determine query and values based on role
-    if current_user.role and current_user.role.lower() == 'admin':
-        logger.info(f"Admin {current_user.user_id} attempting to retrieve workspace {workspace_id_str}")
-        query = f"{base_query};"
-        values = (workspace_id_str,)
+    # Determine statement and values based on role
+    if current_user.is_admin:
+        logger.info("Admin %s attempting to retrieve workspace %s", current_user.user_id, workspace_id_str)
+        statement, query, values = "ws_get_admin", WORKSPACE_GET_ADMIN_SQL, (workspace_id,)
     else:
-        logger.info(f"User {current_user.user_id} attempting to retrieve workspace {workspace_id_str}")
+        logger.info("User %s attempting to retrieve workspace %s", current_user.user_id, workspace_id_str)
         # Include group access check
-        query = f"""
-            {base_query}
-            AND (
-                w.owner_user_id = %s
-                OR w.workspace_id IN (
-                    SELECT wga.workspace_id 
-                    FROM workspace_group_access wga
-                    WHERE wga.group_id IN (
-                        SELECT ugm.group_id 
-                        FROM user_group_memberships ugm 
-                        WHERE ugm.user_id = %s
-                    )
-                )
-            );
-        """
-        values = (workspace_id_str, current_user.user_id, current_user.user_id)
+        group_ids = get_user_group_ids(current_user.user_id)
+        statement, query, values = "ws_get_user", WORKSPACE_GET_USER_SQL, (current_user.user_id, group_ids, workspace_id)
 
     try:
-        with get_db_session() as conn:
-            with conn.cursor() as cur:
-                logger.debug(f"Executing get workspace query: {cur.mogrify(query, values).decode()}")
-                cur.execute(query, values)
+        with get_db_session_ro() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                logger.debug("Executing get workspace statement %s with %s", statement, values)
+                db.execute_prepared(cur, statement, query, values)
                 result = cur.fetchone()
                 if not result:
                     # If admin, workspace just doesn't exist. If user, might not exist or no access.
                     detail_msg = f"Workspace with ID {workspace_id_str} not found."
-                    if not (current_user.role and current_user.role.lower() == 'admin'):
+                    if not current_user.is_admin:
                         detail_msg = f"Workspace with ID {workspace_id_str} not found or you don't have access."
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail_msg)
                 
-                # Convert row to dict using column names from cursor description
-                workspace_dict = dict(zip([desc[0] for desc in cur.description], result))
-                return models.WorkspaceResponse(**workspace_dict) # Validate and return
+                return models.WorkspaceResponse.model_validate(result) # Validate and return
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
-        logger.error(f"Error retrieving workspace {workspace_id_str}: {e}", exc_info=True)
+        logger.error("Error retrieving workspace %s: %s", workspace_id_str, e, exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                            detail="Failed to retrieve workspace details.")
 
+# Config columns an admin may change via update_workspace_config
+UPDATABLE_WORKSPACE_CONFIG_FIELDS = (
+    "config_chunking_method", "config_chunk_size", "config_chunk_overlap",
+    "config_similarity_metric", "config_top_k", "config_hybrid_search",
+    "config_embedding_model",
+)
+
+@functools.lru_cache(maxsize=128)
+def _build_config_update_sql(fields: tuple) -> str:
+    """UPDATE statement for one subset of UPDATABLE_WORKSPACE_CONFIG_FIELDS (at most 127 subsets).
+    RETURNING the same columns as the workspace SELECTs gives a row that maps straight onto
+    WorkspaceResponse, so there's no need to re-read the workspace after the update."""
+    if not set(fields) <= set(UPDATABLE_WORKSPACE_CONFIG_FIELDS):
+        raise ValueError(f"Not updatable workspace config fields: {fields}")
+    set_clause = ", ".join(f"{field} = %s" for field in fields)
+    return (f"UPDATE workspaces w SET {set_clause} WHERE w.workspace_id = %s AND {WORKSPACE_NOT_PENDING_DELETION} "
+            f"RETURNING {WORKSPACE_COLUMNS};")
+
 @app.put("/api/workspaces/{workspace_id}/config",
          response_model=models.WorkspaceResponse, # Return the updated workspace
          tags=[tags_workspaces, tags_admin], # Tag as both workspace and admin
          summary="Update workspace configuration (Admin Only)",
          description="Updates specific configuration settings for a workspace. Requires admin privileges.")
-async def update_workspace_config(
+def update_workspace_config(
     workspace_id: uuid.UUID = Path(..., description="The UUID of the workspace to update"),
     config_data: WorkspaceConfigUpdate = Body(..., description="The configuration fields to update."),
-    current_user: models.User = Depends(require_admin), # Ensure only admins can update config
-    db_conn=Depends(db.get_db_connection) # Use dependency injection for connection
+    current_user: models.User = Depends(require_admin) # Ensure only admins can update config
 ):
     """Updates the configuration for a specific workspace."""
     
@@ -548,131 +715,189 @@ async def update_workspace_config(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
                             detail="No configuration fields provided for update.")
 
-    # Build the SET part of the SQL query dynamically
-    set_clauses = []
-    values = []
-    for key, value in update_data.items():
-        # Basic validation/sanitization could be added here if needed
-        # Ensure the key is a valid column name to prevent SQL injection risk
-        # (though Pydantic model validation helps significantly)
-        if key in [ # Explicitly list allowed config columns
-            "config_chunking_method", "config_chunk_size", "config_chunk_overlap", 
-            "config_similarity_metric", "config_top_k", "config_hybrid_search", 
-            "config_embedding_model"
-        ]:
-            set_clauses.append(f"{key} = %s")
-            values.append(value)
-        else:
-            logger.warning(f"Attempted to update invalid config field: {key}")
-            # Optionally raise an error or just ignore invalid fields
+    # Keep only allowlisted columns, in a fixed order so each subset maps to one cached statement
+    fields = tuple(key for key in UPDATABLE_WORKSPACE_CONFIG_FIELDS if key in update_data)
+    for key in update_data.keys() - set(fields):
+        logger.warning("Attempted to update invalid config field: %s", key)
 
-    if not set_clauses:
+    if not fields:
          raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
                             detail="No valid configuration fields provided for update.")
 
-    sql_set_string = ", ".join(set_clauses)
-    
-    # Append workspace_id to the values tuple for the WHERE clause
-    values.append(str(workspace_id))  # Convert UUID to string here
+    sql = _build_config_update_sql(fields)
+    # SET values in field order, then workspace_id for the WHERE clause
+    values = [update_data[key] for key in fields]
+    values.append(workspace_id)
 
     try:
-        with db_conn.cursor() as cursor:
-            sql = f"UPDATE workspaces SET {sql_set_string} WHERE workspace_id = %s RETURNING *;"
-            cursor.execute(sql, tuple(values))
-            updated_row = cursor.fetchone()
-            
-            if not updated_row:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                                    detail=f"Workspace {workspace_id} not found.")
-            
-            db_conn.commit()
-            logger.info(f"Admin {current_user.user_id} updated config for workspace {workspace_id}")
-            
-            # Map the updated row to the response model
-            # Get the updated config
-            updated_config = get_workspace_config_from_db(workspace_id, db_conn)
-            if updated_config:
-                # Construct the response model from the fetched dict
-                return models.WorkspaceResponse(**updated_config)
-            else:
-                 # Should not happen if RETURNING worked, but as fallback
-                 raise HTTPException(status_code=500, detail="Failed to retrieve updated workspace data.")
-
-    except psycopg2.Error as db_error:
-        logger.error(f"Database error updating workspace config {workspace_id}: {db_error}", exc_info=True)
-        db_conn.rollback()
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                            detail=f"Database error: {db_error}")
-    except HTTPException as http_exc:
-        db_conn.rollback() # Rollback on known HTTP exceptions too
-        raise http_exc # Re-raise the specific HTTP exception
+        with get_db_session() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.execute(sql, tuple(values))
+                updated_workspace = cursor.fetchone()
+                if not updated_workspace:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                        detail=f"Workspace {workspace_id} not found.")
+    except HTTPException:
+        # 404 above, or the 500 get_db_session raises for database errors (already logged and rolled back)
+        raise
     except Exception as e:
-        logger.error(f"Unexpected error updating workspace config {workspace_id}: {e}", exc_info=True)
-        db_conn.rollback()
+        logger.error("Unexpected error updating workspace config %s: %s", workspace_id, e, exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
                             detail="An unexpected error occurred.")
+
+    # Committed by get_db_session - drop cached query configs for this workspace
+    invalidate_workspace_access(workspace_id=workspace_id)
+    logger.info("Admin %s updated config for workspace %s", current_user.user_id, workspace_id)
+    return models.WorkspaceResponse.model_validate(updated_workspace)
+
+# GCS accepts at most 100 calls per batch request
+GCS_DELETE_BATCH_SIZE = 100
+
+def _delete_workspace_files(workspace_id_str: str):
+    """Background task: removes a deleted workspace's uploads. Failures are logged, not retried;
+    anything left behind sits under the workspace's prefix and can be cleaned up by hand."""
+    if IS_LOCAL_DEV:
+        local_workspace_dir = os.path.join(LOCAL_STORAGE_PATH, workspace_id_str)
+        shutil.rmtree(local_workspace_dir, ignore_errors=True)
+        logger.info("Removed local upload folder for deleted workspace %s", workspace_id_str)
+        return
+
+    try:
+        gcs_client = get_gcs_client()
+        blobs = list(gcs_client.list_blobs(GCS_BUCKET_NAME, prefix=f"{workspace_id_str}/"))
+    except Exception as e:
+        logger.error("Could not list GCS objects for deleted workspace %s: %s", workspace_id_str, e, exc_info=True)
+        return
+
+    failed = 0
+    for start in range(0, len(blobs), GCS_DELETE_BATCH_SIZE):
+        batch_blobs = blobs[start:start + GCS_DELETE_BATCH_SIZE]
+        try:
+            # One HTTP request per batch instead of one per object
+            with gcs_client.batch():
+                for blob in batch_blobs:
+                    blob.delete()
+        except Exception as e:
+            failed += len(batch_blobs)
+            logger.error("Failed to delete GCS objects %s-%s for workspace %s: %s",
+                         start, start + len(batch_blobs) - 1, workspace_id_str, e)
+    logger.info("Deleted %s of %s GCS objects for deleted workspace %s",
+                len(blobs) - failed, len(blobs), workspace_id_str)
+
+# --- Workspace Purge ---
+# delete_workspace only marks the workspace (infra/migrations/003); the rows are removed here so
+# a large workspace never turns into one huge, lock-holding transaction.
+WORKSPACE_PURGE_BATCH_SIZE = int(os.getenv("WORKSPACE_PURGE_BATCH_SIZE", "10000"))
+WORKSPACE_PURGE_INTERVAL_SECONDS = float(os.getenv("WORKSPACE_PURGE_INTERVAL_SECONDS", "60"))
+_purge_lock = threading.Lock()
+
+MARK_WORKSPACE_FOR_DELETION_SQL = f"""
+    INSERT INTO workspaces_pending_deletion (workspace_id, marked_by)
+    SELECT w.workspace_id, %(marked_by)s FROM workspaces w
+    WHERE w.workspace_id = %(workspace_id)s AND {WORKSPACE_NOT_PENDING_DELETION}
+    ON CONFLICT (workspace_id) DO NOTHING
+    RETURNING workspace_id;
+"""
+
+PURGE_CHUNK_BATCH_SQL = """
+    DELETE FROM chunks WHERE chunk_id IN (
+        SELECT c.chunk_id
+        FROM chunks c
+        JOIN documents d ON d.doc_id = c.doc_id
+        WHERE d.workspace_id = %s
+        LIMIT %s
+    );
+"""
+
+def _purge_workspace(workspace_id: uuid.UUID):
+    """Deletes one marked workspace: chunks in batches (each its own transaction), then the
+    workspace row, whose cascades remove its documents, group access and deletion mark."""
+    purged_chunks = 0
+    while True:
+        with get_db_session() as conn:
+            with conn.cursor() as cur:
+                cur.execute(PURGE_CHUNK_BATCH_SQL, (workspace_id, WORKSPACE_PURGE_BATCH_SIZE))
+                deleted = cur.rowcount
+        purged_chunks += deleted
+        if deleted < WORKSPACE_PURGE_BATCH_SIZE:
+            break
+    with get_db_session() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM workspaces WHERE workspace_id = %s;", (workspace_id,))
+    # Its access rows cascaded away with the workspace row
+    invalidate_workspace_group_assignments()
+    logger.info("Purged workspace %s (%s chunks)", workspace_id, purged_chunks)
+
+def purge_pending_workspaces():
+    """Blocking: purges every workspace marked for deletion. Runs after each delete request and
+    periodically from the lifespan task (to pick up work left by a restart or another instance).
+    Only one purge runs per process at a time; each workspace is attempted once per call."""
+    if not _purge_lock.acquire(blocking=False):
+        return # Already purging in this process
+    try:
+        attempted = set()
+        while True:
+            with get_db_session_ro() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT workspace_id FROM workspaces_pending_deletion ORDER BY marked_at;")
+                    pending = [row[0] for row in cur if row[0] not in attempted]
+            if not pending:
+                return
+            for workspace_id in pending:
+                attempted.add(workspace_id)
+                try:
+                    _purge_workspace(workspace_id)
+                except Exception as e:
+                    logger.error("Failed to purge workspace %s (will retry later): %s", workspace_id, e)
     finally:
-        # Release connection if using managed connections (depends on db.py)
-        # db.release_db_connection(db_conn) # Assuming db.py handles this or context manager does
-        pass # Context manager should handle release
+        _purge_lock.release()
+
+async def _workspace_purge_loop():
+    """Lifespan task: calls purge_pending_workspaces every WORKSPACE_PURGE_INTERVAL_SECONDS."""
+    while True:
+        try:
+            await asyncio.to_thread(purge_pending_workspaces)
+        except Exception as e:
+            logger.warning(f"Workspace purge pass failed: {e}")
+        await asyncio.sleep(WORKSPACE_PURGE_INTERVAL_SECONDS)
 
 @app.delete("/api/workspaces/{workspace_id}",
             status_code=status.HTTP_204_NO_CONTENT,
             tags=[tags_workspaces, tags_admin],
             summary="Delete a workspace and associated data (Admin Only)",
             description="Deletes a workspace, its documents, chunks, and access permissions. Requires admin privileges.")
-async def delete_workspace(
+def delete_workspace(
+    background_tasks: BackgroundTasks,
     workspace_id: uuid.UUID = Path(..., description="The UUID of the workspace to delete"),
     admin_user: models.User = Depends(require_admin)
 ):
-    """Deletes a workspace and all associated data from the database. TODO: THIS IS ONLY  LOCAL AND WILL NOT WORK ON GCP!"""
+    """Deletes a workspace and all associated data.
+    The workspace is marked for deletion (and hidden from then on) in one short transaction;
+    its rows are purged in batches and its uploaded files (GCS objects, or the local upload
+    folder in LOCAL_DEV) removed by background tasks after the 204 is sent."""
     
     workspace_id_str = str(workspace_id)
-    logger.info(f"Admin {admin_user.user_id} attempting to delete workspace {workspace_id_str}")
+    logger.info("Admin %s attempting to delete workspace %s", admin_user.user_id, workspace_id_str)
 
     # Use a context manager to handle transaction and connection release
     try:
         with get_db_session() as conn:
             with conn.cursor() as cur:
-                # 1. Get all doc_ids associated with the workspace
-                cur.execute("SELECT doc_id FROM documents WHERE workspace_id = %s;", (workspace_id_str,))
-                doc_ids_result = cur.fetchall()
-                doc_ids = [row[0] for row in doc_ids_result]
-                logger.debug(f"Found {len(doc_ids)} documents to delete for workspace {workspace_id_str}")
-
-                # 2. Delete chunks associated with those documents (if any)
-                if doc_ids:
-                    # Need to convert UUIDs to strings if doc_id is UUID
-                    doc_id_strs = [str(doc_id) for doc_id in doc_ids]
-                    cur.execute("DELETE FROM chunks WHERE doc_id = ANY(%s::uuid[]);", (doc_id_strs,))
-                    logger.info(f"Deleted {cur.rowcount} chunks for workspace {workspace_id_str}")
-                
-                # 3. Delete documents associated with the workspace
-                cur.execute("DELETE FROM documents WHERE workspace_id = %s;", (workspace_id_str,))
-                deleted_docs_count = cur.rowcount
-                logger.info(f"Deleted {deleted_docs_count} documents for workspace {workspace_id_str}")
-
-                # 4. Delete workspace group access permissions
-                cur.execute("DELETE FROM workspace_group_access WHERE workspace_id = %s;", (workspace_id_str,))
-                logger.info(f"Deleted {cur.rowcount} group access entries for workspace {workspace_id_str}")
-                
-                # 5. Delete the workspace itself
-                cur.execute("DELETE FROM workspaces WHERE workspace_id = %s RETURNING workspace_id;", (workspace_id_str,))
-                deleted_workspace = cur.fetchone()
-
-                if not deleted_workspace:
-                     # Check if it existed *before* trying to delete documents/chunks
-                     # This logic could be improved by checking existence first
-                     logger.warning(f"Workspace {workspace_id_str} not found for deletion, or already deleted.")
-                     # Even if workspace was not found, associated data might have been orphaned.
-                     # The deletes above would have handled that, so maybe 404 isn't right if docs were deleted.
-                     # For simplicity, let's assume if the final delete fails, it wasn't there initially.
+                cur.execute(MARK_WORKSPACE_FOR_DELETION_SQL,
+                            {"workspace_id": workspace_id, "marked_by": admin_user.user_id})
+                if not cur.fetchone():
+                     logger.warning("Workspace %s not found for deletion, or already deleted.", workspace_id_str)
                      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                          detail=f"Workspace with ID {workspace_id_str} not found.")
                 
-                logger.info(f"Successfully deleted workspace {workspace_id_str}")
+                logger.info("Marked workspace %s for deletion", workspace_id_str)
                 # Transaction committed automatically by get_db_session context manager
 
+        invalidate_workspace_access(workspace_id=workspace_id)
+        invalidate_workspace_group_assignments()
+        # Purging rows and stored files can take a while; the workspace is already hidden, so don't make the caller wait
+        background_tasks.add_task(purge_pending_workspaces)
+        background_tasks.add_task(_delete_workspace_files, workspace_id_str)
         # Return 204 No Content on successful deletion
         return None
         
@@ -681,19 +906,86 @@ async def delete_workspace(
          raise
     except Exception as e:
          # Log unexpected errors during the delete process
-         logger.error(f"Error deleting workspace {workspace_id_str}: {e}", exc_info=True)
+         logger.error("Error deleting workspace %s: %s", workspace_id_str, e, exc_info=True)
          # Let the context manager handle rollback
          raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="An error occurred while deleting the workspace.")
 
 # --- Document/Upload Endpoints ---
 
-# Define allowed file extensions
-ALLOWED_FILE_EXTENSIONS = [
+# Define allowed file extensions (lowercase; frozenset for O(1) membership checks)
+ALLOWED_FILE_EXTENSIONS = frozenset((
     '.txt', '.pdf', '.doc', '.docx', '.html', '.htm', 
     '.csv', '.xls', '.xlsx', '.ppt', '.pptx', '.md',
     '.json', '.xml'
-]
+))
+ALLOWED_FILE_EXTENSIONS_TEXT = ', '.join(sorted(ALLOWED_FILE_EXTENSIONS)) # For error messages
+
+# Content types for the accepted extensions, used when the browser doesn't send a specific one
+EXT_TO_MIME = {
+    '.txt': 'text/plain',
+    '.pdf': 'application/pdf',
+    '.doc': 'application/msword',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.html': 'text/html',
+    '.htm': 'text/html',
+    '.csv': 'text/csv',
+    '.xls': 'application/vnd.ms-excel',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.ppt': 'application/vnd.ms-powerpoint',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    '.md': 'text/markdown',
+    '.json': 'application/json',
+    '.xml': 'application/xml',
+}
+
+# GCS resumable upload chunk size (must be a multiple of 256 KiB)
+GCS_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Files of one upload request saved/uploaded at the same time
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "8"))
+
+def _save_upload_locally(source, local_save_path: str):
+    """Blocking: copies an uploaded file's contents to local_save_path."""
+    with open(local_save_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
+# Local processing worker pool (LOCAL_DEV only)
+LOCAL_PROCESSING_TIMEOUT_SECONDS = 600 # 10 minutes per file, counted from when its job starts
+LOCAL_PROCESSING_WORKERS = int(os.getenv("LOCAL_PROCESSING_WORKERS", "2"))
+
+# Workspace config columns -> processing/main.py default overrides
+LOCAL_PROCESSING_OVERRIDES = {
+    "config_embedding_model": "embedding_model",
+    "config_chunking_method": "chunking_method",
+    "config_chunk_size": "chunk_size",
+    "config_chunk_overlap": "chunk_overlap",
+}
+
+async def _process_local_file(proc_pool, workspace_id_str: str, local_save_path: str,
+                              overrides: Dict[str, Any], result: Dict[str, str]):
+    """Runs the processing pipeline for one saved file on the worker pool and records the outcome in `result`."""
+    filename = result["filename"]
+    logger.info(f"Queueing local processing for {filename} ({local_save_path})")
+    loop = asyncio.get_running_loop()
+    try:
+        from processing import main as processing_main
+        # The time limit is enforced inside the worker, so it only starts once the job leaves the
+        # queue - files waiting behind a busy pool are never timed out (or cancelled) before they run
+        await loop.run_in_executor(
+            proc_pool, processing_main.run_with_timeout, LOCAL_PROCESSING_TIMEOUT_SECONDS,
+            workspace_id_str, local_save_path, overrides
+        )
+        logger.info(f"Local processing completed successfully for {filename}.")
+        result["status"] = "success_processing"
+        result["message"] = "File processed successfully."
+    except TimeoutError:
+        logger.error(f"Local processing timed out for {filename}.")
+        result["status"] = "error_processing_timeout"
+        result["message"] = "File saved locally, but processing timed out."
+    except Exception as proc_err:
+        logger.error(f"Local processing failed for {filename}: {proc_err}", exc_info=True)
+        result["status"] = "error_processing"
+        result["message"] = f"File saved locally, but processing failed: {proc_err} Check backend logs."
 
 @app.post("/api/uploads/direct",
           response_model=List[Dict[str, str]],
@@ -701,6 +993,7 @@ ALLOWED_FILE_EXTENSIONS = [
           summary="Directly upload multiple files to GCS",
           description="Receives multiple files via multipart/form-data and uploads them directly to GCS.")
 async def direct_upload(
+    request: Request,
     # Accept workspace_id as a string from the form data
     workspace_id_str: str = Form(..., description="The workspace UUID (sent as string form data)."),
     files: List[UploadFile] = File(..., description="The files to upload."),
@@ -727,50 +1020,20 @@ async def direct_upload(
                             detail=f"Invalid format for workspace_id: '{workspace_id_str}'. Expected UUID.")
     
     # --- Verify workspace access and get config --- 
-    workspace_config = None
     try:
-        with get_db_session() as conn:
-            # Fetch workspace existence, access, and config in one go
-            access_query = """
-                SELECT w.config_chunking_method, w.config_chunk_size, 
-                       w.config_chunk_overlap, w.config_similarity_metric,
-                       w.config_top_k, w.config_hybrid_search, w.config_embedding_model
-                FROM workspaces w
-                LEFT JOIN workspace_group_access wga ON w.workspace_id = wga.workspace_id
-                LEFT JOIN user_group_memberships ugm ON wga.group_id = ugm.group_id AND ugm.user_id = %s
-                WHERE w.workspace_id = %s AND (w.owner_user_id = %s OR ugm.user_id IS NOT NULL);
-            """
-            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                cur.execute(access_query, (current_user.user_id, str(workspace_id), current_user.user_id))
-                result = cur.fetchone()
-                if not result:
-                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
-                                      detail=f"Workspace not found or you don't have access")
-                    
-                # Store workspace config
-                workspace_config = dict(result)
-                logger.info(f"Retrieved workspace config for query: {workspace_config}")
-            
-            # Get database connection string *after* session is closed
-            if IS_LOCAL_DEV:
-                db_user = os.getenv('DB_USER')
-                db_password = os.getenv('DB_PASSWORD')
-                db_host = os.getenv('DB_HOST', 'localhost')
-                db_port = os.getenv('DB_PORT', '5432')
-                db_name = os.getenv('DB_NAME')
-                if not all([db_user, db_password, db_host, db_name]):
-                    raise HTTPException(status_code=500, detail="Local DB config incomplete")
-                connection_string = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-            else:
-                connection_string = os.getenv('DATABASE_URL')
-                if not connection_string:
-                    raise HTTPException(status_code=500, detail="DATABASE_URL not configured")
-
+        # Same prepared access/config statement as the query endpoint
+        workspace_config = await run_in_threadpool(
+            _fetch_query_workspace_config, current_user.user_id, workspace_id
+        )
     except HTTPException as http_ex:
-        raise http_ex # Re-raise permission/not found errors
+        raise http_ex # Re-raise DB session errors
     except Exception as db_err:
         logger.error(f"Database error during workspace access/config: {db_err}", exc_info=True)
         raise HTTPException(status_code=500, detail="Database error during setup.")
+    if not workspace_config:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
+                            detail=f"Workspace not found or you don't have access")
+    logger.info(f"Retrieved workspace config for upload: {workspace_config}")
 
     if not files or len(files) == 0:
         raise HTTPException(
@@ -778,203 +1041,166 @@ async def direct_upload(
             detail="No files provided for upload."
         )
 
-    results = []
+    # Values shared by every file in this batch - computed once rather than per file
+    workspace_id_str = str(workspace_id)
+    processing_overrides = {
+        key: workspace_config[column]
+        for column, key in LOCAL_PROCESSING_OVERRIDES.items()
+        if workspace_config and workspace_config.get(column)
+    }
+    uploaded_by = current_user.user_id
+    upload_time = datetime.datetime.now(datetime.timezone.utc).isoformat()
     
     # --- Define Local Storage Dir (if needed) --- 
     local_workspace_dir = None
     if IS_LOCAL_DEV:
-        local_workspace_dir = os.path.join(LOCAL_STORAGE_PATH, str(workspace_id))
+        local_workspace_dir = os.path.join(LOCAL_STORAGE_PATH, workspace_id_str)
         os.makedirs(local_workspace_dir, exist_ok=True)
         logger.info(f"Ensured local directory exists: {local_workspace_dir}")
-    
-    # Process each file
-    for file in files:
-        upload_status = "error"
-        upload_message = "An unexpected error occurred."
-        details = {}
-        local_save_path = None
 
+    upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def _handle_one(file: UploadFile) -> Dict[str, str]:
+        """Saves or uploads one file (then processes it locally in LOCAL_DEV) and returns its result entry."""
+        filename = file.filename
+        if not filename:
+            await file.close()
+            return {"filename": "unknown", "status": "error", "message": "Filename could not be determined."}
+
+        # Validate file extension
+        # Only the (short) extension is lowercased, not the whole filename
+        file_extension = os.path.splitext(filename)[1].lower()
+        if file_extension not in ALLOWED_FILE_EXTENSIONS:
+            await file.close()
+            return {"filename": filename, "status": "error",
+                    "message": f"File type {file_extension} not allowed. Allowed types: {ALLOWED_FILE_EXTENSIONS_TEXT}"}
+
+        content_type = file.content_type
+        if not content_type or content_type == "application/octet-stream":
+            content_type = EXT_TO_MIME.get(file_extension, "application/octet-stream")
+
+        local_save_path = None
         try:
-            filename = file.filename
-            content_type = file.content_type
-            
-            if not filename:
-                upload_message = "Filename could not be determined."
-                results.append({"filename": "unknown", "status": upload_status, "message": upload_message})
-                continue
-                
-            # Validate file extension
-            _, file_extension = os.path.splitext(filename.lower())
-            if file_extension not in ALLOWED_FILE_EXTENSIONS:
-                upload_message = f"File type {file_extension} not allowed. Allowed types: {', '.join(ALLOWED_FILE_EXTENSIONS)}"
-                results.append({"filename": filename, "status": upload_status, "message": upload_message})
-                continue
-                
-            # --- Conditional Upload/Save --- 
-            if IS_LOCAL_DEV:
-                # --- Save Locally --- 
-                local_save_path = os.path.join(local_workspace_dir, filename)
-                logger.info(f"Attempting to save file locally to: {local_save_path}")
-                try:
-                    with open(local_save_path, "wb") as buffer:
-                        shutil.copyfileobj(file.file, buffer)
+            async with upload_slots:
+                # --- Conditional Upload/Save --- 
+                if IS_LOCAL_DEV:
+                    # --- Save Locally --- 
+                    local_save_path = os.path.join(local_workspace_dir, filename)
+                    logger.info(f"Attempting to save file locally to: {local_save_path}")
+                    await asyncio.to_thread(_save_upload_locally, file.file, local_save_path)
                     logger.info(f"Successfully saved file locally: {local_save_path}")
-                    upload_status = "success_local"
-                    upload_message = "File saved locally. Triggering processing."
-                    details = {"local_path": local_save_path, "content_type": content_type}
-                except Exception as save_err:
-                    logger.error(f"Failed to save file locally {filename}: {save_err}", exc_info=True)
-                    upload_message = f"Failed to save file locally: {save_err}"
-                    raise # Re-raise to be caught by outer try/except
-
-            else:
-                # --- Upload to GCS --- 
-                if not gcs_client:
-                    raise ConnectionError("GCS Client is not available for cloud upload.")
-                if not GCS_BUCKET_NAME:
-                     raise ValueError("GCS_BUCKET_NAME is not configured for cloud upload.")
+                    result = {
+                        "filename": filename,
+                        "status": "success_local",
+                        "message": "File saved locally. Triggering processing.",
+                        "local_path": local_save_path,
+                        "content_type": content_type
+                    }
+                else:
+                    # --- Upload to GCS --- 
+                    if not gcs_client:
+                        raise ConnectionError("GCS Client is not available for cloud upload.")
+                    if not GCS_BUCKET_NAME:
+                         raise ValueError("GCS_BUCKET_NAME is not configured for cloud upload.")
+                        
+                    object_name = f"{workspace_id_str}/{filename}" # GCS path structure
+                    logger.info(f"Attempting to upload file to gs://{GCS_BUCKET_NAME}/{object_name}")
                     
-                object_name = f"{str(workspace_id)}/{filename}" # GCS path structure
-                logger.info(f"Attempting to upload file to gs://{GCS_BUCKET_NAME}/{object_name}")
-                
-                bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-                blob = bucket.blob(object_name)
-                
-                blob.upload_from_file(
-                    file.file,
-                    content_type=content_type,
-                )
-                
-                # Add metadata (optional but helpful)
-                blob.metadata = {
-                    "uploaded_by": current_user.user_id,
-                    "upload_time": datetime.datetime.now().isoformat(),
-                    "original_filename": filename,
-                    "workspace_id": str(workspace_id) # Store workspace ID in metadata
-                }
-                blob.patch()
-                
-                logger.info(f"Successfully uploaded file to gs://{GCS_BUCKET_NAME}/{object_name}")
-                upload_status = "success_gcs"
-                upload_message = "File uploaded successfully to GCS."
-                details = {"gcs_path": object_name, "content_type": content_type}
-                # NOTE: GCS upload automatically triggers the Cloud Run/Function via Pub/Sub
-                # No explicit trigger needed here for the cloud path.
-
-            # --- Append result for this file (before potential processing trigger) --- 
-            results.append({
-                "filename": filename,
-                "status": upload_status,
-                "message": upload_message,
-                **details
-            })
-
-            # --- Trigger Local Processing (if applicable) --- 
-            if IS_LOCAL_DEV and local_save_path and upload_status == "success_local":
-                processing_script_path = os.path.abspath(os.path.join(
-                    os.path.dirname(__file__), '..', 'processing', 'main.py'
-                ))
-                
-                # Construct command, adding config overrides from DB
-                cmd = [
-                    sys.executable, # Use the same python interpreter
-                    processing_script_path,
-                    '--workspace-id', str(workspace_id),
-                    '--input-type', 'local_file',
-                    '--file-path', local_save_path
-                ]
-                # Add overrides if config was fetched and has values
-                if workspace_config:
-                     if workspace_config.get("embedding_model"):
-                         cmd.extend(['--embedding-model', workspace_config["embedding_model"]])
-                     if workspace_config.get("chunking_method"):
-                          cmd.extend(['--chunking-method', workspace_config["chunking_method"]])
-                     if workspace_config.get("chunk_size"):
-                          cmd.extend(['--chunk-size', str(workspace_config["chunk_size"])])
-                     if workspace_config.get("chunk_overlap"):
-                           cmd.extend(['--chunk-overlap', str(workspace_config["chunk_overlap"])])
-                           
-                logger.info(f"Triggering local processing via subprocess: {' '.join(cmd)}")
-                try:
-                    # Run synchronously for local dev simplicity. Consider async (e.g., background task) for responsiveness.
-                    proc = subprocess.run(
-                        cmd, 
-                        capture_output=True, 
-                        text=True, 
-                        check=False, # Don't raise exception on non-zero exit, just log
-                        cwd=os.path.dirname(processing_script_path), # Run from processing dir
-                        timeout=600 # Add a timeout (10 minutes)
+                    bucket = gcs_client.bucket(GCS_BUCKET_NAME)
+                    blob = bucket.blob(object_name)
+                    # Chunked resumable upload: a failed chunk is retried without restarting from byte 0
+                    blob.chunk_size = GCS_UPLOAD_CHUNK_SIZE
+                    
+                    # Metadata set before the upload ships with the initial request - no separate patch round trip,
+                    # and it is already present when the finalize event triggers processing
+                    blob.metadata = {
+                        "uploaded_by": uploaded_by,
+                        "upload_time": upload_time,
+                        "original_filename": filename,
+                        "workspace_id": workspace_id_str # Store workspace ID in metadata
+                    }
+                    # The GCS client is synchronous; run it off the event loop so files upload concurrently
+                    await asyncio.to_thread(
+                        blob.upload_from_file,
+                        file.file,
+                        content_type=content_type,
+                        size=getattr(file, "size", None)
                     )
                     
-                    if proc.returncode == 0:
-                        logger.info(f"Local processing completed successfully for {filename}.")
-                        logger.debug(f"Local processing stdout:\n{proc.stdout}")
-                        # Update the status in results dict for this file
-                        for res in results:
-                            if res.get("filename") == filename and res.get("local_path") == local_save_path:
-                                res["status"] = "success_processing"
-                                res["message"] = "File processed successfully."
-                                break
-                    else:
-                        logger.error(f"Local processing failed for {filename} with code {proc.returncode}.")
-                        logger.error(f"Stderr: {proc.stderr}")
-                        logger.error(f"Stdout: {proc.stdout}")
-                        # Find the result entry for this file and update its message/status
-                        for res in results:
-                             if res.get("filename") == filename and res.get("local_path") == local_save_path:
-                                 res["status"] = "error_processing"
-                                 res["message"] = f"File saved locally, but processing failed (code {proc.returncode}). Check backend logs."
-                                 break
-                except subprocess.TimeoutExpired:
-                     logger.error(f"Local processing timed out for {filename}.")
-                     # Update status in results
-                     for res in results:
-                          if res.get("filename") == filename and res.get("local_path") == local_save_path:
-                              res["status"] = "error_processing_timeout"
-                              res["message"] = "File saved locally, but processing timed out."
-                              break
-                except Exception as proc_err:
-                    logger.error(f"Error running local processing subprocess for {filename}: {proc_err}", exc_info=True)
-                     # Update status in results
-                    for res in results:
-                         if res.get("filename") == filename and res.get("local_path") == local_save_path:
-                             res["status"] = "error_processing"
-                             res["message"] = f"Error during local processing: {proc_err}"
-                             break
+                    logger.info(f"Successfully uploaded file to gs://{GCS_BUCKET_NAME}/{object_name}")
+                    # NOTE: GCS upload automatically triggers the Cloud Run/Function via Pub/Sub
+                    # No explicit trigger needed here for the cloud path.
+                    result = {
+                        "filename": filename,
+                        "status": "success_gcs",
+                        "message": "File uploaded successfully to GCS.",
+                        "gcs_path": object_name,
+                        "content_type": content_type
+                    }
         except Exception as e:
-            logger.error(f"Failed processing file {file.filename if file else 'unknown'}: {e}", exc_info=True)
-            # Ensure a result entry exists even on error before local save/upload attempt
-            found = False
-            for res in results:
-                if res.get("filename") == file.filename:
-                     res["status"] = "error"
-                     res["message"] = f"Upload/Processing failed: {e}"
-                     found = True
-                     break
-            if not found and file and file.filename:
-                 results.append({
-                     "filename": file.filename,
-                     "status": "error",
-                     "message": f"Upload/Processing failed: {e}"
-                 })
-                
+            logger.error(f"Failed processing file {filename}: {e}", exc_info=True)
+            return {"filename": filename, "status": "error", "message": f"Upload/Processing failed: {e}"}
         finally:
-             if file:
-                 # Ensure file is closed, crucial for subprocess saving
-                 try:
-                     await file.close()
-                 except Exception as close_err:
-                      logger.warning(f"Error closing file {file.filename}: {close_err}")
+            # Ensure the upload's temp file is closed before processing reads the saved copy
+            try:
+                await file.close()
+            except Exception as close_err:
+                logger.warning(f"Error closing file {filename}: {close_err}")
+
+        # --- Local Processing (if applicable) --- 
+        if IS_LOCAL_DEV and local_save_path:
+            await _process_local_file(
+                request.app.state.proc_pool, workspace_id_str, local_save_path, processing_overrides, result
+            )
+        return result
+
+    async def _reject_duplicate(file: UploadFile) -> Dict[str, str]:
+        await file.close()
+        return {"filename": file.filename, "status": "error",
+                "message": "Duplicate filename in this upload; only the first file with this name was accepted."}
+
+    # Files run in parallel, so a repeated filename would be written to (and processed from)
+    # the same path/object concurrently - only the first file with a given name is handled
+    seen_filenames = set()
+    jobs = []
+    for file in files:
+        if file.filename and file.filename in seen_filenames:
+            jobs.append(_reject_duplicate(file))
+        else:
+            seen_filenames.add(file.filename)
+            jobs.append(_handle_one(file))
+
+    # Files are saved/uploaded and then processed in parallel; results keep the request's file order
+    results = await asyncio.gather(*jobs)
    
     # Return results of all uploads/saves
     return results
 
 # --- Admin Group Management Endpoints ---
+# Like the workspace endpoints, the admin and file endpoints below that only make blocking
+# psycopg2/Firebase calls are plain `def`, so FastAPI runs them in its threadpool.
+
+# Short client-side cache for admin lists; the ETag lets repeated polls revalidate cheaply
+ADMIN_LIST_CACHE_CONTROL = "private, max-age=5"
+
+def _make_etag(*parts) -> str:
+    """Builds a quoted strong ETag from a small fingerprint (e.g. max timestamp + row count)."""
+    digest = hashlib.blake2b(":".join(str(p) for p in parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match header already holds this ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
 @app.post("/api/admin/groups", 
           response_model=models.GroupResponse, 
           tags=tags_admin,
           summary="Create a new user group (Admin Only)")
-async def create_group(
+def create_group(
     group_data: models.GroupCreate,
     admin_user: models.User = Depends(require_admin) # Ensures user is admin
 ):
@@ -988,15 +1214,15 @@ async def create_group(
     
     try:
         with get_db_session() as conn:
-            with conn.cursor() as cur:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute(query, values)
-                result = cur.fetchone()
-                if not result:
+                created_group = cur.fetchone()
+                if not created_group:
                     raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                         detail="Failed to create group, no data returned.")
-                created_group = dict(zip([desc[0] for desc in cur.description], result))
                 logger.info(f"Admin {admin_user.user_id} created group: {created_group['group_name']} ({created_group['group_id']})")
-                return models.GroupResponse(**created_group)
+        invalidate_groups()
+        return models.GroupResponse.model_validate(created_group)
     except psycopg2.errors.UniqueViolation:
         logger.warning(f"Admin {admin_user.user_id} attempted to create group with duplicate name: {group_data.group_name}")
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
@@ -1010,23 +1236,33 @@ async def create_group(
          response_model=List[models.GroupResponse], 
          tags=tags_admin,
          summary="List all user groups (Admin Only)")
-async def list_groups(
+def list_groups(
+    request: Request,
+    response: Response,
     admin_user: models.User = Depends(require_admin) # Ensures user is admin
 ):
-    """Lists all user groups. Requires admin privileges."""
-    query = "SELECT group_id, group_name, description, created_at FROM user_groups ORDER BY group_name;"
-    groups = []
+    """Lists all user groups. Requires admin privileges.
+    Supports conditional requests: returns 304 if the client's ETag is still current."""
+    # Run as named prepared statements (db.execute_prepared) - the admin UI polls this list
+    fingerprint_query = "SELECT max(created_at) AS max_created_at, count(*) AS group_count FROM user_groups"
+    query = "SELECT group_id, group_name, description, created_at FROM user_groups ORDER BY group_name"
     try:
         with get_db_session() as conn:
-            with conn.cursor() as cur:
-                cur.execute(query)
-                results = cur.fetchall()
-                if results:
-                    column_names = [desc[0] for desc in cur.description]
-                    for row in results:
-                        groups.append(dict(zip(column_names, row)))
+            # Rows come back as dicts, so they validate straight into GroupResponse
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                db.execute_prepared(cur, "groups_fingerprint", fingerprint_query)
+                fingerprint = cur.fetchone()
+                etag = _make_etag(fingerprint["max_created_at"], fingerprint["group_count"])
+                if _etag_matches(request, etag):
+                    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                                    headers={"ETag": etag, "Cache-Control": ADMIN_LIST_CACHE_CONTROL})
+
+                db.execute_prepared(cur, "groups_list", query)
+                groups = cur.fetchall()
         logger.info(f"Admin {admin_user.user_id} listed all groups.")
-        return [models.GroupResponse(**g) for g in groups]
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = ADMIN_LIST_CACHE_CONTROL
+        return [models.GroupResponse.model_validate(g) for g in groups]
     except Exception as e:
         logger.error(f"Error listing groups: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1036,24 +1272,29 @@ async def list_groups(
             status_code=status.HTTP_204_NO_CONTENT, 
             tags=tags_admin,
             summary="Delete a user group (Admin Only)")
-async def delete_group(
+def delete_group(
     group_id: uuid.UUID = Path(..., description="The UUID of the group to delete"),
     admin_user: models.User = Depends(require_admin) # Ensures user is admin
 ):
     """Deletes a user group by its UUID. Requires admin privileges."""
-    query = "DELETE FROM user_groups WHERE group_id = %s RETURNING group_id;"
+    query = "DELETE FROM user_groups WHERE group_id = $1 RETURNING group_id"
     try:
         with get_db_session() as conn:
             with conn.cursor() as cur:
-                cur.execute(query, (str(group_id),))
+                db.execute_prepared(cur, "group_delete", query, (group_id,))
                 result = cur.fetchone()
                 if not result:
                     logger.warning(f"Admin {admin_user.user_id} attempted to delete non-existent group ID: {group_id}")
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                         detail=f"Group with ID {group_id} not found.")
                 logger.info(f"Admin {admin_user.user_id} deleted group ID: {group_id}")
-                # No content is returned on successful DELETE
-                return None
+        # Memberships/access rows for the group cascade away, so any user's access may change
+        invalidate_workspace_access()
+        invalidate_user_groups()
+        invalidate_groups()
+        invalidate_workspace_group_assignments()
+        # No content is returned on successful DELETE
+        return None
     except HTTPException: # Re-raise 404
         raise
     except Exception as e:
@@ -1065,12 +1306,13 @@ async def delete_group(
          tags=tags_admin,
          status_code=status.HTTP_204_NO_CONTENT,
          summary="Assign/Update groups for a user (Admin Only)")
-async def assign_groups_to_user(
+def assign_groups_to_user(
     user_uid: str = Path(..., description="The Firebase UID of the user to modify"),
     assignment: models.UserGroupAssignment = Body(...),
     admin_user: models.User = Depends(require_admin)
 ):
     """Sets the list of groups a user belongs to. Replaces existing groups. Requires admin privileges."""
+    auth = get_firebase_auth()
     
     # 1. Validate target user exists in Firebase
     try:
@@ -1081,160 +1323,188 @@ async def assign_groups_to_user(
         logger.error(f"Error fetching user {user_uid} from Firebase: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to verify target user.")
 
-    # 2. Validate provided group names exist in the database
-    validated_group_ids = {}
-    if assignment.group_names:
-        # Use psycopg2.extras.execute_values for efficient query if many groups
-        query = "SELECT group_name, group_id FROM user_groups WHERE group_name = ANY(%s);"
-        try:
-            with get_db_session() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(query, (assignment.group_names,))
-                    results = cur.fetchall()
-                    if len(results) != len(set(assignment.group_names)):
-                        found_names = {row[0] for row in results}
-                        missing_names = set(assignment.group_names) - found_names
-                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                            detail=f"Invalid group names provided: {', '.join(missing_names)}")
-                    validated_group_ids = {row[0]: row[1] for row in results} # Map name to ID
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Database error validating group names: {e}", exc_info=True)
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to validate groups.")
-    
-    # 3. Set custom claims in Firebase (preserve existing role)
-    try:
-        current_claims = target_user.custom_claims or {}
-        new_claims = {
-            'role': current_claims.get('role'), # Keep existing role
-            'groups': assignment.group_names # Set the new list of group names
-        }
-        auth.set_custom_user_claims(user_uid, new_claims)
-        logger.info(f"Admin {admin_user.user_id} set groups for user {user_uid} to: {assignment.group_names}")
-    except Exception as e:
-        logger.error(f"Failed to set custom claims for user {user_uid}: {e}", exc_info=True)
-        # Note: Potential inconsistency if DB update fails below, consider more robust transaction handling
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update user claims in Firebase.")
+    # 2-4. Validate groups, rewrite memberships and set claims on a single connection.
+    # Claims are set last, inside the transaction: if Firebase rejects the update the
+    # membership changes are rolled back, so the DB and the token claims stay in sync.
+    # Applies only the difference between the current and requested memberships, in one
+    # statement: rows for dropped groups are deleted, new ones inserted, unchanged ones untouched.
+    sync_query = """
+        WITH target AS (
+            SELECT unnest(%(group_ids)s::uuid[]) AS group_id
+        ), removed AS (
+            DELETE FROM user_group_memberships
+            WHERE user_id = %(user_id)s AND group_id NOT IN (SELECT group_id FROM target)
+        )
+        INSERT INTO user_group_memberships (user_id, group_id)
+        SELECT %(user_id)s, group_id FROM target
+        ON CONFLICT (user_id, group_id) DO NOTHING;
+    """
 
-    # 4. Update user_group_memberships table (Delete old, insert new)
-    delete_query = "DELETE FROM user_group_memberships WHERE user_id = %s;"
-    insert_query = "INSERT INTO user_group_memberships (user_id, group_id) VALUES (%s, %s);"
-    
     try:
+        # Validate provided group names against the cached group table (400 if any don't exist)
+        validated_group_ids = resolve_group_names(assignment.group_names) if assignment.group_names else {}
+
         with get_db_session() as conn: # Uses context manager for commit/rollback
             with conn.cursor() as cur:
-                # Delete existing memberships for the user
-                cur.execute(delete_query, (user_uid,))
-                logger.debug(f"Deleted old group memberships for user {user_uid}")
-                
-                # Insert new memberships if any groups were assigned
-                if validated_group_ids:
-                    insert_values = [(user_uid, group_id) for group_id in validated_group_ids.values()]
-                    psycopg2.extras.execute_batch(cur, insert_query, insert_values)
-                    logger.debug(f"Inserted new group memberships for user {user_uid}")
-        logger.info(f"Successfully updated database group memberships for user {user_uid}")
+                # Sync memberships to the validated groups (an empty list removes them all)
+                try:
+                    cur.execute(sync_query, {"user_id": user_uid, "group_ids": list(validated_group_ids.values())})
+                except psycopg2.errors.ForeignKeyViolation:
+                    # A cached group was deleted (possibly via another process) since it was resolved
+                    invalidate_groups()
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                        detail="One of the requested groups no longer exists. Please retry.")
+                logger.debug(f"Synced group memberships for user {user_uid}")
+
+            # Set custom claims in Firebase (preserve existing role) before the commit
+            try:
+                current_claims = target_user.custom_claims or {}
+                new_claims = {
+                    'role': current_claims.get('role'), # Keep existing role
+                    'groups': assignment.group_names # Set the new list of group names
+                }
+                auth.set_custom_user_claims(user_uid, new_claims)
+            except Exception as e:
+                logger.error(f"Failed to set custom claims for user {user_uid}: {e}", exc_info=True)
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                    detail="Failed to update user claims in Firebase.")
+        invalidate_workspace_access(user_id=user_uid)
+        invalidate_user_groups(user_id=user_uid)
+        invalidate_admin_users()
+        logger.info(f"Admin {admin_user.user_id} set groups for user {user_uid} to: {assignment.group_names}")
         return None # Return 204 No Content
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Database error updating user_group_memberships for {user_uid}: {e}", exc_info=True)
-        # Claims were set, but DB failed - this is an inconsistency!
-        # Ideally, use a more transactional approach or flag the user for reconciliation
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail="Failed to update group memberships in database after claims were set.")
+                            detail="Failed to update group memberships.")
 
 
 @app.put("/api/admin/workspaces/{workspace_id}/groups",
          tags=tags_admin,
          status_code=status.HTTP_204_NO_CONTENT,
          summary="Assign groups that can access a workspace (Admin Only)")
-async def assign_groups_to_workspace(
+def assign_groups_to_workspace(
     workspace_id: uuid.UUID = Path(..., description="The UUID of the workspace to modify"),
     assignment: models.WorkspaceGroupAssignment = Body(...),
     admin_user: models.User = Depends(require_admin)
 ):
     """Sets the list of groups that have access to a specific workspace. Replaces existing assignments."""
     
-    # 1. Validate workspace exists
-    ws_check_query = "SELECT workspace_id FROM workspaces WHERE workspace_id = %s;"
-    try:
-        with get_db_session() as conn:
-            with conn.cursor() as cur:
-                cur.execute(ws_check_query, (str(workspace_id),))
-                if not cur.fetchone():
-                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Workspace with ID {workspace_id} not found.")
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Database error checking workspace {workspace_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to verify workspace.")
-
-    # 2. Validate group IDs exist (optional but good practice)
-    if assignment.group_ids:
-        group_check_query = "SELECT group_id FROM user_groups WHERE group_id = ANY(%s::uuid[]);"
-        try:
-            with get_db_session() as conn:
-                with conn.cursor() as cur:
-                    # Convert UUIDs to strings for the query parameter array
-                    group_id_strs = [str(gid) for gid in assignment.group_ids]
-                    cur.execute(group_check_query, (group_id_strs,))
-                    results = cur.fetchall()
-                    if len(results) != len(set(assignment.group_ids)):
-                         found_ids = {uuid.UUID(row[0]) for row in results}
-                         missing_ids = set(assignment.group_ids) - found_ids
-                         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                             detail=f"Invalid group IDs provided: {', '.join(map(str, missing_ids))}")
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Database error validating group IDs: {e}", exc_info=True)
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to validate groups.")
-
-    # 3. Update workspace_group_access table (Delete old, insert new)
-    delete_query = "DELETE FROM workspace_group_access WHERE workspace_id = %s;"
-    insert_query = "INSERT INTO workspace_group_access (workspace_id, group_id) VALUES (%s, %s);"
+    # 1-2. Check the workspace exists and which of the requested groups don't, in one round trip.
+    # The diff runs server-side: only missing group IDs come back (none on the normal path).
+    validate_query = f"""
+        SELECT EXISTS (SELECT 1 FROM workspaces w WHERE w.workspace_id = %s AND {WORKSPACE_NOT_PENDING_DELETION}),
+               ARRAY(SELECT g.id FROM unnest(%s::uuid[]) AS g(id)
+                     LEFT JOIN user_groups u ON u.group_id = g.id
+                     WHERE u.group_id IS NULL);
+    """
+    # 3. Rewrite workspace_group_access in one statement: rows for dropped groups are deleted,
+    # new ones inserted and unchanged ones left alone (same diffing approach as user memberships)
+    sync_query = """
+        WITH target AS (
+            SELECT DISTINCT unnest(%(group_ids)s::uuid[]) AS group_id
+        ), removed AS (
+            DELETE FROM workspace_group_access
+            WHERE workspace_id = %(workspace_id)s AND group_id NOT IN (SELECT group_id FROM target)
+        )
+        INSERT INTO workspace_group_access (workspace_id, group_id)
+        SELECT %(workspace_id)s, group_id FROM target
+        ON CONFLICT (workspace_id, group_id) DO NOTHING;
+    """
     
     try:
         with get_db_session() as conn:
             with conn.cursor() as cur:
-                cur.execute(delete_query, (str(workspace_id),))
-                logger.debug(f"Deleted old group access for workspace {workspace_id}")
-                
-                if assignment.group_ids:
-                    insert_values = [(str(workspace_id), str(group_id)) for group_id in assignment.group_ids]
-                    psycopg2.extras.execute_batch(cur, insert_query, insert_values)
-                    logger.debug(f"Inserted new group access for workspace {workspace_id}")
+                # UUIDs are adapted natively (see db.init_db_pool), so the list binds as uuid[]
+                cur.execute(validate_query, (workspace_id, assignment.group_ids))
+                workspace_exists, missing_ids = cur.fetchone()
+                if not workspace_exists:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Workspace with ID {workspace_id} not found.")
+                if missing_ids:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                        detail=f"Invalid group IDs provided: {', '.join(map(str, missing_ids))}")
+
+                # An empty list removes all access rows
+                cur.execute(sync_query, {"workspace_id": workspace_id, "group_ids": assignment.group_ids})
+                logger.debug(f"Synced group access for workspace {workspace_id}")
+        invalidate_workspace_access(workspace_id=workspace_id)
+        invalidate_workspace_group_assignments()
         logger.info(f"Admin {admin_user.user_id} updated group access for workspace {workspace_id} to groups: {assignment.group_ids}")
         return None # Return 204 No Content
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Database error updating workspace_group_access for {workspace_id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to update workspace group access in database.")
 
+# Pages of the Firebase user list for the admin UI, keyed by (page_token, max_results). Each page is
+# a Firebase round trip (~1s per 1000 users), so repeated dashboard loads are served from this
+# per-process cache; claim changes invalidate it.
+ADMIN_USERS_CACHE_TTL_SECONDS = float(os.getenv("ADMIN_USERS_CACHE_TTL_SECONDS", "20"))
+admin_users_cache = cache.TTLCache(maxsize=256, ttl=ADMIN_USERS_CACHE_TTL_SECONDS, name="admin_users")
+FIREBASE_LIST_USERS_MAX_PAGE_SIZE = 1000 # Firebase's maximum page size
+
+_EMPTY_CLAIMS = {} # Shared stand-in for users without custom claims (never mutated)
+
+def _ms_to_datetime(ms: Optional[int]) -> Optional[datetime.datetime]:
+    """Firebase millisecond timestamp -> aware UTC datetime (None if unset)."""
+    return datetime.datetime.fromtimestamp(ms / 1000.0, tz=datetime.timezone.utc) if ms else None
+
+def _to_user_admin_view(user_record) -> models.UserAdminView:
+    # Firebase SDK records are already well-formed, so skip validation (model_construct);
+    # timestamps are converted here since model_construct doesn't coerce them
+    claims = user_record.custom_claims or _EMPTY_CLAIMS
+    metadata = user_record.user_metadata
+    return models.UserAdminView.model_construct(
+        user_id=user_record.uid,
+        email=user_record.email,
+        disabled=user_record.disabled,
+        last_sign_in=_ms_to_datetime(metadata.last_sign_in_timestamp) if metadata else None,
+        created=_ms_to_datetime(metadata.creation_timestamp) if metadata else None,
+        role=claims.get('role'),
+        groups=claims.get('groups') or []
+    )
+
+def _fetch_firebase_users_page(page_token: Optional[str], max_results: int) -> dict:
+    """Blocking: fetches one page of Firebase users, returned as a JSON-ready UserAdminPage dict."""
+    auth = get_firebase_auth()
+    page = auth.list_users(page_token=page_token, max_results=max_results)
+    return models.UserAdminPage.model_construct(
+        users=[_to_user_admin_view(user_record) for user_record in page.users],
+        next_page_token=page.next_page_token or None # The SDK uses '' for "no more pages"
+    ).model_dump(mode="json") # Serialized once here, then reused from the cache
+
+def invalidate_admin_users():
+    """Drops the cached Firebase user list (after a user's role or groups change)."""
+    admin_users_cache.invalidate()
+
 @app.get("/api/admin/users",
-         response_model=List[models.UserAdminView],
+         response_model=models.UserAdminPage,
          tags=tags_admin,
-         summary="List all Firebase users (Admin Only)")
+         summary="List Firebase users, one page at a time (Admin Only)")
 async def list_all_users(
+    page_token: Optional[str] = Query(None, description="next_page_token from the previous page; omit for the first page."),
+    max_results: int = Query(100, ge=1, le=FIREBASE_LIST_USERS_MAX_PAGE_SIZE, description="Users per page."),
     admin_user: models.User = Depends(require_admin)
 ):
-    """Lists all users from Firebase Authentication, including their custom claims."""
-    users = []
+    """Lists users from Firebase Authentication, including their custom claims, one page at a time.
+    Pages are served from a short per-process cache; the Firebase call runs off the event loop."""
     try:
-        # Iterate through all users. This could be slow for many users.
-        # Consider pagination for production: list_users(page_token=next_page_token)
-        for user_record in auth.list_users().iterate_all():
-            claims = user_record.custom_claims or {}
-            users.append(models.UserAdminView(
-                user_id=user_record.uid,
-                email=user_record.email,
-                disabled=user_record.disabled,
-                last_sign_in=user_record.user_metadata.last_sign_in_timestamp / 1000.0 if user_record.user_metadata and user_record.user_metadata.last_sign_in_timestamp else None,
-                created=user_record.user_metadata.creation_timestamp / 1000.0 if user_record.user_metadata and user_record.user_metadata.creation_timestamp else None,
-                role=claims.get('role'),
-                groups=claims.get('groups', [])
-            ))
-        logger.info(f"Admin {admin_user.user_id} listed all Firebase users.")
-        return users
+        page = await run_in_threadpool(
+            admin_users_cache.get_or_set,
+            (page_token, max_results),
+            lambda: _fetch_firebase_users_page(page_token, max_results)
+        )
+        logger.info(f"Admin {admin_user.user_id} listed {len(page['users'])} Firebase users.")
+        # Returned as a response directly: the cached page is already serialized, so there is
+        # nothing for response_model validation to add
+        response_class = ORJSONResponse if orjson else JSONResponse
+        return response_class(content=page)
+    except ValueError as e: # Malformed page token
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid page token: {e}")
     except Exception as e:
         logger.error(f"Failed to list Firebase users: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve user list from Firebase.")
@@ -1243,12 +1513,13 @@ async def list_all_users(
          tags=tags_admin,
          status_code=status.HTTP_204_NO_CONTENT,
          summary="Set role for a user (Admin Only)")
-async def set_user_role(
+def set_user_role(
     user_uid: str = Path(..., description="The Firebase UID of the user to modify"),
     admin_user: models.User = Depends(require_admin), # Dependency first
     role_data: models.UserRoleAssignment = Body(...)   # Body parameter last
 ):
     """Sets the role (e.g., 'admin' or 'user') for a specific user. Requires admin privileges."""
+    auth = get_firebase_auth()
     
     # Validate target user exists
     try:
@@ -1276,6 +1547,7 @@ async def set_user_role(
             del new_claims['role']
             
         auth.set_custom_user_claims(user_uid, new_claims)
+        invalidate_admin_users()
         logger.info(f"Admin {admin_user.user_id} set role for user {user_uid} to: {new_role}")
         return None # 204 No Content
     except Exception as e:
@@ -1286,75 +1558,272 @@ async def set_user_role(
          response_model=models.WorkspaceGroupAssignment, # Re-use the model for structure
          tags=tags_admin,
          summary="Get groups assigned to a specific workspace (Admin Only)")
-async def get_workspace_groups(
+def get_workspace_groups(
     workspace_id: uuid.UUID = Path(..., description="The UUID of the workspace"),
     admin_user: models.User = Depends(require_admin)
 ):
     """Retrieves the list of group IDs assigned to a specific workspace."""
-    query = "SELECT group_id FROM workspace_group_access WHERE workspace_id = %s;"
-    group_ids = []
+    # One trip: no row means the workspace doesn't exist, an empty array means no groups assigned
+    query = f"""
+        SELECT array_remove(array_agg(wga.group_id), NULL)
+        FROM workspaces w
+        LEFT JOIN workspace_group_access wga ON wga.workspace_id = w.workspace_id
+        WHERE w.workspace_id = %s AND {WORKSPACE_NOT_PENDING_DELETION}
+        GROUP BY w.workspace_id;
+    """
     try:
-        with get_db_session() as conn:
+        with get_db_session_ro() as conn:
             with conn.cursor() as cur:
-                cur.execute(query, (str(workspace_id),))
-                results = cur.fetchall()
-                if results:
-                    group_ids = [row[0] for row in results] # Fetchall returns tuples
+                cur.execute(query, (workspace_id,))
+                row = cur.fetchone()
+        if row is None:
+            logger.warning(f"Admin {admin_user.user_id} tried to get groups for non-existent workspace {workspace_id}")
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Workspace with ID {workspace_id} not found.")
+        group_ids = row[0]
         logger.info(f"Admin {admin_user.user_id} retrieved groups for workspace {workspace_id}: {group_ids}")
-        # We need to return in the format expected by WorkspaceGroupAssignment, which expects a list of UUIDs
         return models.WorkspaceGroupAssignment(group_ids=group_ids)
+    except HTTPException: # Re-raise 404
+        raise
     except Exception as e:
-        # Check if workspace itself exists, maybe add a check before this query? Good practice.
-        ws_check_query = "SELECT 1 FROM workspaces WHERE workspace_id = %s;"
-        try:
-            with get_db_session() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(ws_check_query, (str(workspace_id),))
-                    if not cur.fetchone():
-                         logger.warning(f"Admin {admin_user.user_id} tried to get groups for non-existent workspace {workspace_id}")
-                         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Workspace with ID {workspace_id} not found.")
-        except HTTPException: # Re-raise 404
-             raise
-        except Exception as check_err:
-             logger.error(f"Error checking workspace existence for {workspace_id} during group retrieval: {check_err}", exc_info=True)
-             # Fall through to general error if check fails
-
         logger.error(f"Error retrieving groups for workspace {workspace_id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to retrieve groups for workspace.")
 
+ASSIGNMENTS_FETCH_BATCH_SIZE = 2000 # Rows per round trip when reading the full access table
+
+# The full access table, as (loaded_at, etag, rows), cached per process with stale-while-revalidate:
+# entries older than the fresh window are still served while one background thread reloads them,
+# and only entries past the max-stale TTL (or invalidated by a write) are reloaded inline.
+ASSIGNMENTS_CACHE_FRESH_SECONDS = float(os.getenv("ASSIGNMENTS_CACHE_FRESH_SECONDS", "30"))
+ASSIGNMENTS_CACHE_MAX_STALE_SECONDS = float(os.getenv("ASSIGNMENTS_CACHE_MAX_STALE_SECONDS", "300"))
+assignments_cache = cache.TTLCache(maxsize=1, ttl=ASSIGNMENTS_CACHE_MAX_STALE_SECONDS, name="workspace_group_assignments")
+_assignments_refresh_lock = threading.Lock()
+
+def _load_workspace_group_assignments() -> tuple:
+    """Blocking: reads the whole access table and fingerprints exactly the rows read."""
+    # Aliased "w" so the shared pending-deletion filter applies (it only needs w.workspace_id).
+    # Ordered so the fingerprint is stable; the table has no timestamps to build an ETag from.
+    query = f"""
+        SELECT workspace_id::text, group_id::text
+        FROM workspace_group_access w
+        WHERE {WORKSPACE_NOT_PENDING_DELETION}
+        ORDER BY workspace_id, group_id;
+    """
+    # One statement, one snapshot: the ETag is hashed from the same rows that get cached
+    content_hash = hashlib.md5()
+    assignments = []
+    # Named cursors need a transaction, so not the autocommit read-only session
+    with get_db_session() as conn:
+        # Server-side cursor: rows arrive in batches of itersize instead of one big fetchall() list
+        with conn.cursor(name="workspace_group_assignments") as cur:
+            cur.itersize = ASSIGNMENTS_FETCH_BATCH_SIZE
+            cur.execute(query)
+            for workspace_id, group_id in cur:
+                content_hash.update(f"{workspace_id}:{group_id},".encode())
+                assignments.append({"workspace_id": workspace_id, "group_id": group_id})
+    return time.monotonic(), _make_etag(len(assignments), content_hash.hexdigest()), assignments
+
+def _refresh_workspace_group_assignments():
+    """Reloads the cached access table in the background; a refresh already running wins."""
+    if not _assignments_refresh_lock.acquire(blocking=False):
+        return
+    try:
+        assignments_cache.refresh("all", _load_workspace_group_assignments)
+    except Exception as e:
+        logger.warning(f"Background refresh of workspace-group assignments failed: {e}")
+    finally:
+        _assignments_refresh_lock.release()
+
+def invalidate_workspace_group_assignments():
+    """Drops the cached access table (after group access rows are written or cascade away)."""
+    assignments_cache.invalidate()
+
 @app.get("/api/admin/workspace-group-assignments",
          response_model=List[models.WorkspaceGroupAccessEntry],
          tags=tags_admin,
          summary="Get all workspace-group assignments (Admin Only)")
-async def get_all_workspace_group_assignments(
+def get_all_workspace_group_assignments(
+    request: Request,
     admin_user: models.User = Depends(require_admin)
 ):
-    """Retrieves all (workspace_id, group_id) pairs from the access table."""
-    query = "SELECT workspace_id, group_id FROM workspace_group_access;"
-    assignments = []
+    """Retrieves all (workspace_id, group_id) pairs from the access table.
+    Served from a per-process stale-while-revalidate cache.
+    Supports conditional requests: returns 304 if the client's ETag is still current."""
     try:
-        with get_db_session() as conn:
-            with conn.cursor() as cur:
-                cur.execute(query)
-                results = cur.fetchall()
-                if results:
-                    # Convert rows to the Pydantic model format
-                    assignments = [models.WorkspaceGroupAccessEntry(workspace_id=row[0], group_id=row[1]) for row in results]
+        loaded_at, etag, assignments = assignments_cache.get_or_set("all", _load_workspace_group_assignments)
+        if (time.monotonic() - loaded_at > ASSIGNMENTS_CACHE_FRESH_SECONDS
+                and not _assignments_refresh_lock.locked()):
+            threading.Thread(target=_refresh_workspace_group_assignments, daemon=True,
+                             name="assignments-refresh").start()
+        if _etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                            headers={"ETag": etag, "Cache-Control": ADMIN_LIST_CACHE_CONTROL})
         logger.info(f"Admin {admin_user.user_id} retrieved all workspace-group assignments.")
-        return assignments
+        # The rows come straight from the table's typed columns, so they are returned as-is
+        # rather than re-validated into a WorkspaceGroupAccessEntry per row
+        response_class = ORJSONResponse if orjson else JSONResponse
+        return response_class(content=assignments,
+                              headers={"ETag": etag, "Cache-Control": ADMIN_LIST_CACHE_CONTROL})
     except Exception as e:
         logger.error(f"Error retrieving all workspace-group assignments: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to retrieve workspace-group assignments.")
 
 # --- Add the query endpoint ---
+
+# Per-process cap on concurrent LLM streams; extra requests wait for a slot (while receiving
+# keep-alives) and are rejected with 503 once too many are already waiting.
+MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "32"))
+MAX_QUEUED_STREAMS = int(os.getenv("MAX_QUEUED_STREAMS", "32"))
+_stream_semaphore = asyncio.Semaphore(MAX_CONCURRENT_STREAMS)
+# Streams admitted (running or waiting for a slot). Reserved by the query handler itself, before the
+# response starts, so a burst of requests can't all pass the admission check before any is counted.
+_admitted_streams = 0
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse that gives back its admission once the response ends, however it ends
+    (including a client that goes away before the body is ever iterated)."""
+    async def __call__(self, scope, receive, send):
+        global _admitted_streams
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _admitted_streams -= 1
+
+@asynccontextmanager
+async def _stream_slot():
+    """Holds one of the MAX_CONCURRENT_STREAMS slots for the duration of a stream."""
+    await _stream_semaphore.acquire()
+    try:
+        yield
+    finally:
+        _stream_semaphore.release()
+
+# How often (in upstream chunks) the query stream checks whether the client has gone away
+STREAM_DISCONNECT_CHECK_EVERY = 16
+
+# Coalescing window for streamed SSE frames: LLM tokens arrive a few bytes at a time,
+# so batch them into fewer, larger writes (flushed by size or after a short delay).
+# Starlette sends each yielded chunk as one http.response.body message, so this is the send size.
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", str(64 * 1024)))
+STREAM_FLUSH_INTERVAL_SECONDS = float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "20")) / 1000
+# An SSE comment is sent after this many idle seconds so proxies/load balancers keep the stream open
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
+SSE_KEEPALIVE_FRAME = b": keepalive\n\n"
+SSE_RESPONSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no", # Stop nginx-style proxies from buffering the stream
+}
+
+async def _coalesce_stream(source, max_bytes: int = STREAM_FLUSH_BYTES, max_delay: float = STREAM_FLUSH_INTERVAL_SECONDS,
+                           keepalive: float = STREAM_KEEPALIVE_SECONDS):
+    """Re-chunks an async iterator of SSE bytes, yielding when max_bytes are buffered or
+    max_delay seconds have passed since the first buffered byte. If the source is idle
+    for `keepalive` seconds (e.g. during retrieval), an SSE comment frame is sent."""
+    loop = asyncio.get_running_loop()
+    iterator = source.__aiter__()
+    buffer = bytearray()
+    deadline = None
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            # Wait for the next chunk, but no longer than the flush deadline if data is buffered
+            # (or the keepalive interval if not). asyncio.wait, unlike wait_for, leaves `pending`
+            # running on timeout.
+            timeout = max(0.0, deadline - loop.time()) if buffer else keepalive
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield bytes(buffer) if buffer else SSE_KEEPALIVE_FRAME
+                buffer.clear()
+                continue
+
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            if not buffer:
+                deadline = loop.time() + max_delay
+            buffer += chunk
+            if len(buffer) >= max_bytes:
+                yield bytes(buffer)
+                buffer.clear()
+
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        # Close the source right away (client abort or early exit) so its own cleanup, e.g. closing
+        # the LLM stream and releasing the stream slot, doesn't wait for garbage collection
+        aclose = getattr(iterator, "aclose", None)
+        if aclose:
+            await aclose()
+
+# Fetch workspace existence, access, and config in one go.
+# Executed as a named prepared statement (db.execute_prepared), hence the $n placeholders.
+QUERY_WORKSPACE_ACCESS_SQL = f"""
+    SELECT w.config_chunking_method, w.config_chunk_size, 
+           w.config_chunk_overlap, w.config_similarity_metric,
+           w.config_top_k, w.config_hybrid_search, w.config_embedding_model
+    FROM workspaces w
+    WHERE w.workspace_id = $1 AND {WORKSPACE_NOT_PENDING_DELETION}
+      AND (w.owner_user_id = $2 OR EXISTS (
+          SELECT 1
+          FROM workspace_group_access wga
+          JOIN user_group_memberships ugm ON ugm.group_id = wga.group_id
+          WHERE wga.workspace_id = w.workspace_id AND ugm.user_id = $2))
+"""
+
+def _fetch_query_workspace_config(user_id: str, workspace_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+    """Blocking access check + config lookup for the query and upload endpoints.
+    Returns the workspace config dict, or None if the workspace doesn't exist or the user lacks access.
+    Run it via run_in_threadpool so the psycopg2 round trip doesn't stall the event loop."""
+    with get_db_session_ro() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            db.execute_prepared(cur, "query_workspace_access", QUERY_WORKSPACE_ACCESS_SQL,
+                                (workspace_id, user_id))
+            result = cur.fetchone()
+            return dict(result) if result else None
+
+async def _resolve_workspace_access(user_id: str, workspace_id: uuid.UUID):
+    """Returns (workspace_config, connection_string) for a query, or raises HTTPException
+    (404 if the workspace is missing/inaccessible, 500 on DB or configuration errors)."""
+    try:
+        # Served from the per-process access cache when warm; misses are single-flighted per key
+        workspace_config = await run_in_threadpool(
+            workspace_access_cache.get_or_set,
+            (user_id, workspace_id),
+            lambda: _fetch_query_workspace_config(user_id, workspace_id)
+        )
+        # Built once per process and cached
+        connection_string = db.get_connection_string()
+    except ValueError as config_err:
+        raise HTTPException(status_code=500, detail=str(config_err))
+    except (psycopg2.Error, ConnectionError) as db_err:
+        # Pool/driver failures outside a session (get_db_session already maps in-session errors to 500)
+        logger.error(f"Database error during workspace access/config: {db_err}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Database error during setup.")
+
+    if not workspace_config:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
+                            detail=f"Workspace not found or you don't have access")
+    logger.info(f"Retrieved workspace config for query: {workspace_config}")
+    return workspace_config, connection_string
+
 @app.post("/api/query",
           # response_model removed for streaming
           tags=tags_queries,
           summary="Query the RAG system (Streaming)")
 async def query_documents_stream( # Renamed
-    query_data: Dict[str, Any] = Body(..., description="Query data including text, workspace ID, and optional history"),
+    request: Request,
+    query_data: models.QueryRequest = Body(..., description="Query data including text, workspace ID, and optional history"),
     current_user: models.User = Depends(get_current_user)
 ):
     """
@@ -1362,92 +1831,53 @@ async def query_documents_stream( # Renamed
     Accepts optional chat history for context.
     Streams the response back to the client.
     """
-    try:
-        # Extract and validate required fields
-        if 'query' not in query_data or not query_data['query'].strip():
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Query text is required")
-        if 'workspace_id' not in query_data or not query_data['workspace_id']:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="workspace_id is required")
-        
-        try:
-            workspace_id = str(uuid.UUID(query_data['workspace_id']))
-        except ValueError:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid workspace_id format: {query_data['workspace_id']}")
-
-        # Verify workspace access (using a context manager for the session)
-        connection_string = None
-        workspace_config = None
-        try:
-            with get_db_session() as conn:
-                # Fetch workspace existence, access, and config in one go
-                access_query = """
-                    SELECT w.config_chunking_method, w.config_chunk_size, 
-                           w.config_chunk_overlap, w.config_similarity_metric,
-                           w.config_top_k, w.config_hybrid_search, w.config_embedding_model
-                    FROM workspaces w
-                    LEFT JOIN workspace_group_access wga ON w.workspace_id = wga.workspace_id
-                    LEFT JOIN user_group_memberships ugm ON wga.group_id = ugm.group_id AND ugm.user_id = %s
-                    WHERE w.workspace_id = %s AND (w.owner_user_id = %s OR ugm.user_id IS NOT NULL);
-                """
-                with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    cur.execute(access_query, (current_user.user_id, str(workspace_id), current_user.user_id))
-                    result = cur.fetchone()
-                    if not result:
-                        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
-                                          detail=f"Workspace not found or you don't have access")
-                    
-                    # Store workspace config
-                    workspace_config = dict(result)
-                    logger.info(f"Retrieved workspace config for query: {workspace_config}")
-            
-            # Get database connection string *after* session is closed
-            if IS_LOCAL_DEV:
-                db_user = os.getenv('DB_USER')
-                db_password = os.getenv('DB_PASSWORD')
-                db_host = os.getenv('DB_HOST', 'localhost')
-                db_port = os.getenv('DB_PORT', '5432')
-                db_name = os.getenv('DB_NAME')
-                if not all([db_user, db_password, db_host, db_name]):
-                    raise HTTPException(status_code=500, detail="Local DB config incomplete")
-                connection_string = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-            else:
-                connection_string = os.getenv('DATABASE_URL')
-                if not connection_string:
-                    raise HTTPException(status_code=500, detail="DATABASE_URL not configured")
-
-        except HTTPException as http_ex:
-            raise http_ex # Re-raise permission/not found errors
-        except Exception as db_err:
-            logger.error(f"Database error during workspace access/config: {db_err}", exc_info=True)
-            raise HTTPException(status_code=500, detail="Database error during setup.")
-
-        # Set defaults and overrides
-        # Use workspace config values as defaults, but allow query params to override
-        embedding_model = query_data.get('embedding_model', workspace_config.get('config_embedding_model'))
-        top_k = query_data.get('top_k', workspace_config.get('config_top_k', 4))
-        # Let get_llm handle the default logic based on env var or fallback
-        llm_model = query_data.get('model', None) 
-        chat_history = query_data.get('chat_history', [])
-        temperature = query_data.get('temperature', 0.2) 
-        
-        # We retrieved hybrid_search setting but process_query_stream doesn't support it yet
-        # hybrid_search = query_data.get('hybrid_search', workspace_config.get('config_hybrid_search', False))
-        
-        logger.info(f"Using query params: embedding_model={embedding_model}, top_k={top_k}")
-        
-        # Correctly check if the imported function is available
-        if not process_query_stream:
-            logger.error("process_query_stream function is not available (import likely failed).")
-            raise HTTPException(status_code=501, detail="Streaming query function unavailable.")
-
-        # Define the async generator for streaming
-        async def stream_generator():
+    # Required fields and types are validated by models.QueryRequest (422 on bad input)
+    workspace_id = str(query_data.workspace_id) # The pipeline filters chunk metadata by the string form
+
+    # Verify workspace access and load its config (the UUID binds natively, see db.init_db_pool)
+    workspace_config, connection_string = await _resolve_workspace_access(current_user.user_id, query_data.workspace_id)
+
+    # Set defaults and overrides
+    # Use workspace config values as defaults, but allow query params to override
+    embedding_model = query_data.embedding_model or workspace_config.get('config_embedding_model')
+    top_k = query_data.top_k or workspace_config.get('config_top_k') or 4
+    # Let get_llm handle the default logic based on env var or fallback
+    llm_model = query_data.model
+    chat_history = query_data.chat_history
+    temperature = query_data.temperature
+    
+    # We retrieved hybrid_search setting but process_query_stream doesn't support it yet
+    # hybrid_search = query_data.get('hybrid_search', workspace_config.get('config_hybrid_search', False))
+    
+    logger.info(f"Using query params: embedding_model={embedding_model}, top_k={top_k}")
+    
+    # Import the pipeline on first use (off the event loop); None if the import failed
+    process_query_stream = await run_in_threadpool(get_query_stream_function)
+    if not process_query_stream:
+        logger.error("process_query_stream function is not available (import likely failed).")
+        raise HTTPException(status_code=501, detail="Streaming query function unavailable.")
+
+    # Shed load instead of queueing without bound when every stream slot is busy
+    global _admitted_streams
+    if _admitted_streams >= MAX_CONCURRENT_STREAMS + MAX_QUEUED_STREAMS:
+        logger.warning(f"Rejecting query from {current_user.user_id}: {_admitted_streams} streams active or queued")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Server is busy, please retry shortly.",
+                            headers={"Retry-After": "5"})
+
+    # Define the async generator for streaming
+    query_preview = query_data.query[:30]
+    log_info = logger.isEnabledFor(logging.INFO)
+
+    async def stream_generator():
+        async with _stream_slot():
             try:
-                logger.info(f"Starting stream for query '{query_data['query'][:30]}...' in workspace {workspace_id}")
-                
+                if log_info:
+                    logger.info(f"Starting stream for query '{query_preview}...' in workspace {workspace_id}")
+            
                 # Variables to collect debug metadata
                 debug_metadata = {
-                    "query": query_data['query'],
+                    "query": query_data.query,
                     "workspace_id": workspace_id,
                     "embedding_model": embedding_model,
                     "llm_model": llm_model,
@@ -1456,10 +1886,10 @@ async def query_documents_stream( # Renamed
                     "start_time": datetime.datetime.now().isoformat(),
                     "retrieved_chunks": []
                 }
-                
+            
                 # Call the imported function directly
                 stream = process_query_stream(
-                    query=query_data['query'],
+                    query=query_data.query,
                     workspace_id=workspace_id,
                     connection_string=connection_string,
                     embedding_model_name=embedding_model,
@@ -1467,26 +1897,35 @@ async def query_documents_stream( # Renamed
                     top_k=top_k,
                     chat_history=chat_history,
                     temperature=temperature,
-                    collect_metadata=True  # Signal that we want to collect metadata
+                    collect_metadata=True,  # Signal that we want to collect metadata
+                    user_id=current_user.user_id  # Access is re-checked inside the retrieval query
                 )
-                
-                async for data in stream:
-                    # Check if this is a text chunk or metadata
-                    if isinstance(data, dict) and "metadata" in data:
-                        # Store retrieved chunk information
-                        if "retrieved_chunks" in data["metadata"]:
-                            debug_metadata["retrieved_chunks"] = data["metadata"]["retrieved_chunks"]
-                        # Store any other metadata
-                        for key, value in data["metadata"].items():
-                            if key != "retrieved_chunks":
-                                debug_metadata[key] = value
-                        # Metadata itself will be sent at the end as a single debug event
-                    elif isinstance(data, str):
-                        # It's a normal text chunk - yield correctly formatted SSE message
-                        yield sse_event("message", data)
-                    else:
-                        # Log unexpected data type from stream
-                        logger.warning(f"Received unexpected data type from stream: {type(data)} - {data}")
+            
+                try:
+                    chunk_count = 0
+                    async for data in stream:
+                        # Stop pulling from the LLM as soon as the client has gone away
+                        chunk_count += 1
+                        if chunk_count % STREAM_DISCONNECT_CHECK_EVERY == 0 and await request.is_disconnected():
+                            logger.info(f"Client disconnected; stopping stream for workspace {workspace_id}")
+                            return
+                        # Text chunks are the hot path: one exact type check, then straight to SSE
+                        if type(data) is str:
+                            yield sse_event("message", data)
+                            continue
+                        if isinstance(data, dict) and "metadata" in data:
+                            # Merge retrieved chunks and any other metadata in one C-level update;
+                            # it is sent at the end as a single debug event
+                            debug_metadata.update(data["metadata"])
+                        elif isinstance(data, str):
+                            yield sse_event("message", data)
+                        else:
+                            # Log unexpected data type from stream
+                            logger.warning(f"Received unexpected data type from stream: {type(data)} - {data}")
+                finally:
+                    # Close the upstream generator deterministically (client abort, error or early return)
+                    # so the LLM call is cancelled and its buffers are released right away
+                    await stream.aclose()
 
                 # Add end time to metadata
                 debug_metadata["end_time"] = datetime.datetime.now().isoformat()
@@ -1500,9 +1939,10 @@ async def query_documents_stream( # Renamed
                         logger.warning("Could not calculate duration from isoformat times.")
 
                 # Yield the complete debug metadata as a single event at the end
-                yield sse_event("debug", json.dumps(debug_metadata))
+                yield sse_json_event("debug", debug_metadata)
 
-                logger.info(f"Finished stream for query '{query_data['query'][:30]}...' in workspace {workspace_id}")
+                if log_info:
+                    logger.info(f"Finished stream for query '{query_preview}...' in workspace {workspace_id}")
             except Exception as stream_err:
                 logger.error(f"Error during response streaming: {stream_err}", exc_info=True)
                 # Send error as a message event (using the helper)
@@ -1511,26 +1951,34 @@ async def query_documents_stream( # Renamed
                 error_metadata = {
                     "error": str(stream_err),
                     "error_type": type(stream_err).__name__,
-                    "query": query_data['query'],
+                    "query": query_data.query,
                     "workspace_id": workspace_id
                 }
-                yield sse_event("debug", json.dumps(error_metadata))
-
-        # Return the StreamingResponse with correct media type for SSE
-        return StreamingResponse(stream_generator(), media_type="text/event-stream")
-
-    except HTTPException as http_ex:
-        logger.error(f"HTTP Exception in query stream endpoint: {http_ex.detail}")
-        raise http_ex
-    except Exception as e:
-        logger.error(f"Unexpected error setting up query stream: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to initiate query stream: {str(e)}")
+                yield sse_json_event("debug", error_metadata)
+
+    # Reserve the admission now (no await between the check above and here); the response
+    # releases it when it finishes
+    _admitted_streams += 1
+    # Return the StreamingResponse with correct media type for SSE
+    return _AdmittedStreamingResponse(_coalesce_stream(stream_generator()), media_type="text/event-stream",
+                                      headers=SSE_RESPONSE_HEADERS)
+
+# Whether %(user_id)s may read workspace %(workspace_id)s (owner or group member, not pending deletion).
+# Embedded in the file endpoints' queries so the access check shares their round trip.
+FILES_ACCESS_CHECK_SQL = f"""EXISTS (
+    SELECT 1 FROM workspaces w
+    WHERE w.workspace_id = %(workspace_id)s AND {WORKSPACE_NOT_PENDING_DELETION}
+      AND (w.owner_user_id = %(user_id)s OR EXISTS (
+          SELECT 1
+          FROM workspace_group_access wga
+          JOIN user_group_memberships ugm ON ugm.group_id = wga.group_id
+          WHERE wga.workspace_id = w.workspace_id AND ugm.user_id = %(user_id)s)))"""
 
 @app.get("/api/workspaces/{workspace_id}/files/count",
          response_model=Dict[str, int],
          tags=tags_workspaces,
          summary="Get file count for a workspace")
-async def get_workspace_file_count(
+def get_workspace_file_count(
     workspace_id: uuid.UUID = Path(..., description="The UUID of the workspace"),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -1539,39 +1987,26 @@ async def get_workspace_file_count(
     - Returns count of documents associated with the workspace.
     - User must have access to the workspace.
     """
-    workspace_id_str = str(workspace_id) # Convert UUID to string for psycopg2
-    
-    # First check if user has access to the workspace
-    access_query = """
-        SELECT 1
-        FROM workspaces w
-        LEFT JOIN workspace_group_access wga ON w.workspace_id = wga.workspace_id
-        LEFT JOIN user_group_memberships ugm ON wga.group_id = ugm.group_id AND ugm.user_id = %s
-        WHERE w.workspace_id = %s AND (w.owner_user_id = %s OR ugm.user_id IS NOT NULL);
-    """
+    workspace_id_str = str(workspace_id)
     
-    # Query to count documents
-    count_query = """
-        SELECT COUNT(*) as file_count
-        FROM documents
-        WHERE workspace_id = %s;
+    # Access check and count in one round trip; the count is skipped when there's no access
+    count_query = f"""
+        WITH access AS (SELECT {FILES_ACCESS_CHECK_SQL} AS ok)
+        SELECT access.ok,
+               CASE WHEN access.ok THEN (SELECT COUNT(*) FROM documents WHERE workspace_id = %(workspace_id)s) END
+        FROM access;
     """
     
     try:
-        with get_db_session() as conn:
-            # First verify access
+        with get_db_session_ro() as conn:
             with conn.cursor() as cur:
-                cur.execute(access_query, (current_user.user_id, workspace_id_str, current_user.user_id))
-                if not cur.fetchone():
+                cur.execute(count_query, {"workspace_id": workspace_id, "user_id": current_user.user_id})
+                has_access, file_count = cur.fetchone()
+                if not has_access:
                     logger.warning(f"User {current_user.user_id} attempted to access file count for workspace {workspace_id_str} without permission")
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
                                         detail=f"Workspace not found or you don't have access")
                 
-                # Get file count
-                cur.execute(count_query, (workspace_id_str,))
-                result = cur.fetchone()
-                file_count = result[0] if result else 0
-                
                 logger.info(f"User {current_user.user_id} retrieved file count ({file_count}) for workspace {workspace_id_str}")
                 return {"count": file_count}
     except HTTPException:
@@ -1585,7 +2020,7 @@ async def get_workspace_file_count(
          response_model=List[Dict[str, Any]],
          tags=tags_workspaces,
          summary="Get files list for a workspace")
-async def get_workspace_files(
+def get_workspace_files(
     workspace_id: uuid.UUID = Path(..., description="The UUID of the workspace"),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -1594,48 +2029,35 @@ async def get_workspace_files(
     - Returns list of documents associated with the workspace.
     - User must have access to the workspace.
     """
-    workspace_id_str = str(workspace_id) # Convert UUID to string for psycopg2
-    
-    # First check if user has access to the workspace
-    access_query = """
-        SELECT 1
-        FROM workspaces w
-        LEFT JOIN workspace_group_access wga ON w.workspace_id = wga.workspace_id
-        LEFT JOIN user_group_memberships ugm ON wga.group_id = ugm.group_id AND ugm.user_id = %s
-        WHERE w.workspace_id = %s AND (w.owner_user_id = %s OR ugm.user_id IS NOT NULL);
-    """
+    workspace_id_str = str(workspace_id)
     
-    # Query to get documents
-    files_query = """
-        SELECT doc_id, filename, status, uploaded_at, metadata
-        FROM documents
-        WHERE workspace_id = %s
-        ORDER BY uploaded_at DESC;
+    # Access check and document list in one round trip. There is always at least one row:
+    # ok=false means no access, and a single row with a NULL doc_id means an empty workspace.
+    # doc_id and uploaded_at are rendered as strings by Postgres, so rows are returned as-is.
+    files_query = f"""
+        WITH access AS (SELECT {FILES_ACCESS_CHECK_SQL} AS ok)
+        SELECT access.ok, d.doc_id::text AS doc_id, d.filename, d.status,
+               to_char(d.uploaded_at, 'YYYY-MM-DD"T"HH24:MI:SS.USTZH:TZM') AS uploaded_at, d.metadata
+        FROM access
+        LEFT JOIN documents d ON access.ok AND d.workspace_id = %(workspace_id)s
+        ORDER BY d.uploaded_at DESC;
     """
     
     try:
-        with get_db_session() as conn:
-            # First verify access
-            with conn.cursor() as cur:
-                cur.execute(access_query, (current_user.user_id, workspace_id_str, current_user.user_id))
-                if not cur.fetchone():
+        with get_db_session_ro() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(files_query, {"workspace_id": workspace_id, "user_id": current_user.user_id})
+                rows = cur.fetchall()
+                if not rows[0]["ok"]:
                     logger.warning(f"User {current_user.user_id} attempted to access files for workspace {workspace_id_str} without permission")
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
                                         detail=f"Workspace not found or you don't have access")
                 
-                # Get files
-                cur.execute(files_query, (workspace_id_str,))
-                results = cur.fetchall()
                 files = []
-                
-                column_names = [desc[0] for desc in cur.description]
-                for row in results:
-                    file_dict = dict(zip(column_names, row))
-                    # Convert any non-serializable objects
-                    if isinstance(file_dict.get('doc_id'), uuid.UUID):
-                        file_dict['doc_id'] = str(file_dict['doc_id'])
-                    if isinstance(file_dict.get('uploaded_at'), datetime.datetime):
-                        file_dict['uploaded_at'] = file_dict['uploaded_at'].isoformat()
+                for file_dict in rows:
+                    if file_dict['doc_id'] is None: # Empty workspace
+                        continue
+                    del file_dict['ok']
                     files.append(file_dict)
                 
                 logger.info(f"User {current_user.user_id} retrieved {len(files)} files for workspace {workspace_id_str}")
@@ -1653,7 +2075,7 @@ async def get_workspace_files(
             tags=[tags_uploads, tags_admin],
             summary="Delete a specific document and its chunks (Admin Only)",
             description="Deletes a document record, its associated chunks from the database, and attempts to delete the corresponding file from local storage if LOCAL_DEV is true. Requires admin privileges.")
-async def delete_document(
+def delete_document(
     workspace_id: uuid.UUID = Path(..., description="The UUID of the workspace containing the document"),
     doc_id: uuid.UUID = Path(..., description="The UUID of the document to delete"),
     current_user: models.User = Depends(require_admin) # Ensure only admins can delete
@@ -1674,10 +2096,11 @@ async def delete_document(
     try:
         with get_db_session() as db_conn: # Use the context manager
             with db_conn.cursor() as cursor:
-                # 1. Find the document and its path
+                # 1. Delete the document and get its path back in the same round trip; its chunks
+                #    go with it via ON DELETE CASCADE (infra/migrations/001)
                 cursor.execute(
-                    "SELECT gcs_path, filename FROM documents WHERE doc_id = %s AND workspace_id = %s",
-                    (doc_id_str, workspace_id_str)
+                    "DELETE FROM documents WHERE doc_id = %s AND workspace_id = %s RETURNING gcs_path, filename",
+                    (doc_id, workspace_id)
                 )
                 doc_info = cursor.fetchone()
 
@@ -1687,7 +2110,7 @@ async def delete_document(
                                         detail=f"Document {doc_id_str} not found in workspace {workspace_id_str}.")
                     
                 doc_path, filename = doc_info # Get filename for logging
-                logger.info(f"Found document '{filename}' with path: {doc_path}")
+                logger.info(f"Deleted document '{filename}' (and its chunks) with path: {doc_path}")
                 
                 # Determine local file path
                 if IS_LOCAL_DEV and doc_path:
@@ -1695,30 +2118,17 @@ async def delete_document(
                     logger.info(f"Determined local file path for potential deletion: {local_file_path_to_delete}")
                 elif IS_LOCAL_DEV and not doc_path:
                     logger.warning(f"Document {doc_id_str} has null path. Cannot determine local file path for deletion.")
-
-                # 2. Delete associated chunks
-                cursor.execute("DELETE FROM chunks WHERE doc_id = %s", (doc_id_str,))
-                deleted_chunks_count = cursor.rowcount
-                logger.info(f"Deleted {deleted_chunks_count} chunks associated with document {doc_id_str}")
-
-                # 3. Delete the document record
-                cursor.execute("DELETE FROM documents WHERE doc_id = %s", (doc_id_str,))
-                deleted_docs_count = cursor.rowcount
-                if deleted_docs_count == 0:
-                    logger.warning(f"Document {doc_id_str} was not found for deletion after deleting chunks.")
-                    # Rollback will happen automatically due to exception
-                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document disappeared during deletion process.")
             
             # Commit happens automatically when exiting the 'with get_db_session()' block if no exceptions
         
-        # 4. Attempt to delete the file from local storage (AFTER DB transaction)
+        # 2. Attempt to delete the file from local storage (AFTER DB transaction)
         if local_file_path_to_delete:
             try:
-                if os.path.exists(local_file_path_to_delete):
-                    os.remove(local_file_path_to_delete)
-                    logger.info(f"Successfully deleted local file: {local_file_path_to_delete}")
-                else:
-                    logger.warning(f"Local file not found, skipping deletion: {local_file_path_to_delete}")
+                # One syscall: unlink and treat "already gone" as a warning, instead of stat + remove
+                os.unlink(local_file_path_to_delete)
+                logger.info(f"Successfully deleted local file: {local_file_path_to_delete}")
+            except FileNotFoundError:
+                logger.warning(f"Local file not found, skipping deletion: {local_file_path_to_delete}")
             except OSError as os_err:
                 # Log error but don't fail the request, as DB entry is gone
                 logger.error(f"Error deleting local file {local_file_path_to_delete}: {os_err}")
@@ -1743,14 +2153,31 @@ async def delete_document(
 
 # --- End of file ---
 
+# --- Helper Function for JSON Payloads ---
+def dumps_json_bytes(data: Any) -> bytes:
+    """Serializes data to compact UTF-8 JSON, using orjson when installed.
+    Values json can't encode natively (datetime, UUID, ...) fall back to str()."""
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, default=str, separators=(",", ":")).encode("utf-8")
+
 # --- Helper Function for Correct SSE Formatting ---
-def sse_event(event_type: str, data: str) -> str:
+def sse_event(event_type: str, data: str) -> bytes:
     """
-    Build a correctly framed SSE event.
+    Build a correctly framed SSE event, encoded as UTF-8 bytes.
     Every line must start with 'data:' (even empty lines).
     Handles multi-line data correctly.
+    Returning bytes lets StreamingResponse send each frame without re-encoding it.
     """
+    if "\n" not in data and "\r" not in data:
+        # Common case for streamed tokens: a single line, no splitting needed
+        return f"event: {event_type}\ndata: {data}\n\n".encode("utf-8")
     # splitlines() handles different newline types and removes trailing newline
     data_lines = data.splitlines() or ['']  # Ensure at least one 'data:' line for empty data
     payload = '\n'.join(f"data: {line}" for line in data_lines)
-    return f"event: {event_type}\n{payload}\n\n"
+    return f"event: {event_type}\n{payload}\n\n".encode("utf-8")
+
+def sse_json_event(event_type: str, data: Any) -> bytes:
+    """Builds an SSE event whose data is `data` as JSON, framed directly as bytes.
+    Compact JSON never contains raw newlines, so it always fits on a single 'data:' line."""
+    return b"event: " + event_type.encode("utf-8") + b"\ndata: " + dumps_json_bytes(data) + b"\n\n"
@@ -14,6 +14,11 @@ const UserManagement = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   
+  // Users are paged: nextPageToken is null once the last page is loaded
+  const [nextPageToken, setNextPageToken] = useState(null);
+  const [loadedPages, setLoadedPages] = useState(0);
+  const [loadingMore, setLoadingMore] = useState(false);
+  
   // State for user actions
   const [editRoleId, setEditRoleId] = useState(null);
   const [selectedRole, setSelectedRole] = useState('');
@@ -33,13 +38,15 @@ const UserManagement = () => {
     const fetchData = async () => {
       setLoading(true);
       try {
-        const [usersData, groupsData] = await Promise.all([
+        const [usersPage, groupsData] = await Promise.all([
           listUsers(),
           listGroups()
         ]);
-        console.log('Fetched Users:', usersData);
+        console.log('Fetched Users:', usersPage.users);
         console.log('Fetched Groups:', groupsData);
-        setUsers(usersData);
+        setUsers(usersPage.users);
+        setNextPageToken(usersPage.nextPageToken);
+        setLoadedPages(1);
         setGroups(groupsData);
         setError(null);
       } catch (err) {
@@ -108,13 +115,40 @@ const UserManagement = () => {
     setGroupStatus({ message: '', isError: false });
   };
   
-  // Add a function to refresh user data
+  // Load the next page of users and append it to the list
+  const loadMoreUsers = async () => {
+    if (!nextPageToken) return;
+    setLoadingMore(true);
+    try {
+      const usersPage = await listUsers({ pageToken: nextPageToken });
+      setUsers(prevUsers => [...prevUsers, ...usersPage.users]);
+      setNextPageToken(usersPage.nextPageToken);
+      setLoadedPages(pages => pages + 1);
+    } catch (err) {
+      console.error('Error loading more users:', err);
+      setGroupStatus({ message: 'שגיאה בטעינת משתמשים נוספים', isError: true });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+  
+  // Add a function to refresh user data (only the pages already shown are re-fetched)
   const refreshUsers = async () => {
     try {
       setLoading(true);
-      const usersData = await listUsers();
+      const usersData = [];
+      let pageToken = null;
+      let pages = 0;
+      do {
+        const usersPage = await listUsers({ pageToken });
+        usersData.push(...usersPage.users);
+        pageToken = usersPage.nextPageToken;
+        pages += 1;
+      } while (pageToken && pages < loadedPages);
       console.log('Refreshed users data:', usersData);
       setUsers(usersData);
+      setNextPageToken(pageToken);
+      setLoadedPages(pages);
     } catch (err) {
       console.error('Error refreshing users:', err);
       setGroupStatus({ message: 'שגיאה בטעינת נתוני משתמשים מעודכנים', isError: true });
@@ -542,6 +576,16 @@ const UserManagement = () => {
         </div>
       ))}
       
+      {nextPageToken && (
+        <button
+          style={buttonStyle}
+          onClick={loadMoreUsers}
+          disabled={loadingMore}
+        >
+          {loadingMore ? 'טוען...' : 'טען משתמשים נוספים'}
+        </button>
+      )}
+      
       {users.length === 0 && !loading && (
         <p>אין משתמשים להצגה.</p>
       )}
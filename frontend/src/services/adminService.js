@@ -1,13 +1,21 @@
 import api from './apiService';
 
+// Users fetched per request; the admin view loads further pages on demand
+const USERS_PAGE_SIZE = 100;
+
 /**
- * Fetches all users from Firebase (admin only).
- * @returns {Promise<Array>} A promise that resolves to an array of user objects.
+ * Fetches one page of users from Firebase (admin only).
+ * @param {Object} [options]
+ * @param {string|null} [options.pageToken] - Token from a previous page's nextPageToken; omit for the first page.
+ * @param {number} [options.maxResults] - Page size (the backend allows up to 1000).
+ * @returns {Promise<{users: Array, nextPageToken: string|null}>} The page's users and the token for the next page (null on the last page).
  */
-const listUsers = async () => {
+const listUsers = async ({ pageToken = null, maxResults = USERS_PAGE_SIZE } = {}) => {
   try {
-    const response = await api.get('/admin/users');
-    return response.data;
+    const params = { max_results: maxResults };
+    if (pageToken) params.page_token = pageToken;
+    const response = await api.get('/admin/users', { params });
+    return { users: response.data.users, nextPageToken: response.data.next_page_token || null };
   } catch (error) {
     console.error("Error fetching users:", error.response?.data || error.message);
     throw error;
@@ -0,0 +1,30 @@
+-- Make chunk rows follow their document on delete, so removing a document (or a workspace,
+-- via documents.workspace_id ON DELETE CASCADE) is a single statement on the database side.
+-- Safe to re-run: replaces whatever foreign key chunks.doc_id currently has.
+
+BEGIN;
+
+DO $$
+DECLARE
+    fk_name text;
+BEGIN
+    FOR fk_name IN
+        SELECT con.conname
+        FROM pg_constraint con
+        JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = ANY (con.conkey)
+        WHERE con.conrelid = 'chunks'::regclass
+          AND con.contype = 'f'
+          AND att.attname = 'doc_id'
+    LOOP
+        EXECUTE format('ALTER TABLE chunks DROP CONSTRAINT %I', fk_name);
+    END LOOP;
+END $$;
+
+ALTER TABLE chunks
+    ADD CONSTRAINT chunks_doc_id_fkey
+    FOREIGN KEY (doc_id) REFERENCES documents(doc_id) ON DELETE CASCADE;
+
+-- The cascade (and the backend's chunk deletes) look chunks up by doc_id
+CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks USING btree (doc_id);
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- Make everything owned by a workspace follow it on delete, so the backend can remove a
+-- workspace with a single DELETE FROM workspaces (chunks follow documents via 001).
+-- Safe to re-run: replaces whatever foreign key each column currently has.
+
+BEGIN;
+
+DO $$
+DECLARE
+    target record;
+    fk_name text;
+BEGIN
+    FOR target IN
+        SELECT * FROM (VALUES ('documents', 'documents_workspace_id_fkey'),
+                              ('workspace_group_access', 'workspace_group_access_workspace_id_fkey'))
+                      AS t(table_name, constraint_name)
+    LOOP
+        FOR fk_name IN
+            SELECT con.conname
+            FROM pg_constraint con
+            JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = ANY (con.conkey)
+            WHERE con.conrelid = target.table_name::regclass
+              AND con.contype = 'f'
+              AND att.attname = 'workspace_id'
+        LOOP
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', target.table_name, fk_name);
+        END LOOP;
+
+        EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I FOREIGN KEY (workspace_id) '
+                       'REFERENCES workspaces(workspace_id) ON DELETE CASCADE',
+                       target.table_name, target.constraint_name);
+    END LOOP;
+END $$;
+
+COMMIT;
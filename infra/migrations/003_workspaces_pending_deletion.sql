@@ -0,0 +1,10 @@
+-- Staging table for workspace deletes. The API marks a workspace here and returns at once;
+-- the backend's purge task then removes its chunks in small batches (one short transaction
+-- each) before deleting the workspace row itself, which also clears the mark via the cascade.
+-- Marked workspaces are hidden from every workspace lookup in the meantime.
+
+CREATE TABLE IF NOT EXISTS workspaces_pending_deletion (
+    workspace_id uuid PRIMARY KEY REFERENCES workspaces(workspace_id) ON DELETE CASCADE,
+    marked_by character varying(255) NULL, -- Admin who requested the delete
+    marked_at timestamp with time zone NOT NULL DEFAULT now()
+);
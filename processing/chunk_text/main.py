@@ -1,6 +1,6 @@
 import logging
 import argparse
-import json
+import sys
 from typing import List, Dict, Any, Optional, Union
 import os
 
@@ -14,6 +14,12 @@ from langchain_text_splitters import (
     SentenceTransformersTokenTextSplitter
 )
 
+# Shared JSON / JSON Lines step-output helpers (the project root isn't on sys.path when a step runs as a script)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+from processing.jsonl_io import read_records, write_records
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -30,18 +36,15 @@ CHUNKER_MAPPING = {
 
 def load_documents_from_json(file_path: str) -> List[Document]:
     """
-    Load documents from a JSON file in the format produced by the extract_text module.
+    Load documents from a JSON or JSON Lines file in the format produced by the extract_text module.
     """
     if not os.path.exists(file_path):
         logger.error(f"File not found: {file_path}")
         raise FileNotFoundError(f"File not found: {file_path}")
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
         documents = []
-        for item in data:
+        for item in read_records(file_path):
             doc = Document(
                 page_content=item["text"],
                 metadata=item.get("metadata", {})
@@ -189,10 +192,7 @@ def main():
         # Save to output file if specified
         if args.output:
             # Convert documents to serializable format
-            serializable_docs = [{"text": doc.page_content, "metadata": doc.metadata} for doc in chunked_docs]
-            
-            with open(args.output, 'w', encoding='utf-8') as f:
-                json.dump(serializable_docs, f, ensure_ascii=False, indent=2)
+            write_records(args.output, ({"text": doc.page_content, "metadata": doc.metadata} for doc in chunked_docs))
             
             logger.info(f"Saved {len(chunked_docs)} chunks to {args.output}")
         
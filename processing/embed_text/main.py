@@ -1,13 +1,27 @@
 import os
 import logging
 import argparse
-import json
+import sys
 from typing import List, Dict, Any, Optional, Union
 import uuid
 import datetime
+import hashlib
+import base64
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
 
 from langchain.schema.document import Document
 from langchain_google_vertexai import VertexAIEmbeddings
+from google.api_core.exceptions import ResourceExhausted
+
+# Shared JSON / JSON Lines step-output helpers (the project root isn't on sys.path when a step runs as a script)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+from processing.jsonl_io import read_records, write_records
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -31,20 +45,142 @@ EMBEDDING_MODELS = {
     # Add other Vertex AI embedding models here if needed
 }
 
+# Optional on-disk cache of embeddings keyed by (model, sha256(text)); disabled unless set.
+# Re-indexing a workspace mostly re-embeds chunks that haven't changed, so this skips those API calls.
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")
+EMBED_CACHE_LOOKUP_BATCH = 500 # Keys per SELECT, below SQLite's bound-parameter limit
+
+# Vertex AI rejects embedding requests above ~20k input tokens, so batches are capped by an
+# estimated token count as well as by size (roughly 4 characters per token).
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "20000"))
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+def length_bucketed_batches(texts: List[str], indices: List[int], max_count: int,
+                            max_tokens: int = EMBED_BATCH_MAX_TOKENS) -> List[List[int]]:
+    """
+    Group indices into texts into batches of similar-length texts.
+    
+    Sorting by length keeps short chunks together, and the token cap gives long chunks
+    smaller batches instead of letting one of them push a full batch over the request limit.
+    A single text over the cap still gets a batch of its own.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for index in sorted(indices, key=lambda i: len(texts[i])):
+        tokens = len(texts[index]) // CHARS_PER_TOKEN_ESTIMATE + 1
+        if batch and (len(batch) >= max_count or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+# Embedding calls are network-bound, so several batches are kept in flight at once.
+# Quota errors (429) are retried with exponential backoff before the step fails.
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "8"))
+EMBED_MAX_RETRIES = 5
+EMBED_RETRY_BASE_DELAY_SECONDS = 1.0
+
+def _embed_batch_with_retry(embedding_model, batch_texts: List[str]) -> List[List[float]]:
+    """Embeds one batch, backing off and retrying while Vertex AI reports quota exhaustion."""
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            return embedding_model.embed_documents(batch_texts)
+        except ResourceExhausted:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            delay = EMBED_RETRY_BASE_DELAY_SECONDS * (2 ** attempt)
+            logger.warning(f"Embedding quota exhausted; retrying batch in {delay:.0f}s (attempt {attempt + 1}/{EMBED_MAX_RETRIES})")
+            time.sleep(delay)
+
+class DiskEmbeddingCache:
+    """SQLite-backed store of embedding vectors (as float32 bytes) keyed by model name and text hash."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Several pipeline runs (backend pool workers, concurrent CLI runs) may share one file:
+        # wait for locks instead of failing immediately, and let readers proceed during writes
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash BLOB NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, model_name: str, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Returns {hash: vector} for the hashes that are cached for model_name."""
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique_hashes), EMBED_CACHE_LOOKUP_BATCH):
+            batch = unique_hashes[i:i+EMBED_CACHE_LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [model_name, *batch]
+            )
+            for text_hash, vector in rows:
+                found[text_hash] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, model_name: str, items: List[tuple]):
+        """Stores (hash, vector) pairs for model_name in one transaction."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes()) for text_hash, vector in items]
+            )
+
+    def close(self):
+        self.conn.close()
+
+# On-disk encodings for embeddings in the step output (store_data dequantizes them on load).
+# int8 keeps one scale per vector (max |x| / 127); fp16 is a plain half-precision cast.
+QUANTIZATION_MODES = ("none", "int8", "fp16")
+
+def quantize_embedding(embedding, mode: str) -> Dict[str, Any]:
+    """Returns the output fields for one embedding: the vector as-is, or a base64 quantized payload."""
+    if mode == "none":
+        return {"embedding": embedding}
+    vector = np.asarray(embedding, dtype=np.float32)
+    if mode == "int8":
+        max_abs = float(np.max(np.abs(vector))) if vector.size else 0.0
+        scale = max_abs / 127 if max_abs else 1.0
+        quantized = np.round(vector / scale).astype(np.int8)
+        return {"embedding_q": base64.b64encode(quantized.tobytes()).decode("ascii"),
+                "embedding_dtype": "int8", "embedding_scale": scale}
+    if mode == "fp16":
+        return {"embedding_q": base64.b64encode(vector.astype(np.float16).tobytes()).decode("ascii"),
+                "embedding_dtype": "float16"}
+    raise ValueError(f"Unsupported quantization mode: {mode}. Supported modes: {', '.join(QUANTIZATION_MODES)}")
+
+def quantize_documents(embedded_documents: List[Dict[str, Any]], mode: str = "none"):
+    """Yields embedded documents ready to serialize, with embeddings encoded per the given mode."""
+    for doc in embedded_documents:
+        record = {"text": doc["text"], "metadata": doc["metadata"]}
+        record.update(quantize_embedding(doc["embedding"], mode))
+        yield record
+
 def load_documents_from_json(file_path: str) -> List[Document]:
     """
-    Load documents from a JSON file in the format produced by the chunk_text module.
+    Load documents from a JSON or JSON Lines file in the format produced by the chunk_text module.
     """
     if not os.path.exists(file_path):
         logger.error(f"File not found: {file_path}")
         raise FileNotFoundError(f"File not found: {file_path}")
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
         documents = []
-        for item in data:
+        for item in read_records(file_path):
             doc = Document(
                 page_content=item["text"],
                 metadata=item.get("metadata", {})
@@ -103,7 +239,7 @@ def embed_documents(
         batch_size: Number of documents to process in each batch (Vertex AI has limits).
     
     Returns:
-        List of documents with embeddings.
+        List of documents with embeddings (as float32 numpy arrays).
     """
     try:
         # Get the embedding model
@@ -111,19 +247,61 @@ def embed_documents(
         
         # Extract the texts from the documents
         texts = [doc.page_content for doc in documents]
+        all_embeddings = [None] * len(texts)
         
-        # Process documents in batches
-        all_embeddings = []
-        # Use the specified batch size, respecting potential model limits (e.g., 250 for gecko)
-        effective_batch_size = min(batch_size, 250) 
-        logger.info(f"Using effective batch size of {effective_batch_size} for Vertex AI embedding")
-        
-        for i in range(0, len(texts), effective_batch_size):
-            batch_texts = texts[i:i+effective_batch_size]
-            logger.info(f"Embedding batch {i//effective_batch_size + 1}/{(len(texts) + effective_batch_size - 1) // effective_batch_size}")
-            # VertexAIEmbeddings handles batching internally via embed_documents
-            batch_embeddings = embedding_model.embed_documents(batch_texts)
-            all_embeddings.extend(batch_embeddings)
+        # Fill what we can from the embedding cache; only the misses go to Vertex AI
+        # The cache is best-effort: any cache error is logged and the step carries on uncached
+        embedding_cache = None
+        if EMBED_CACHE_PATH:
+            try:
+                embedding_cache = DiskEmbeddingCache(EMBED_CACHE_PATH)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Embedding cache at {EMBED_CACHE_PATH} unavailable, embedding without it: {e}")
+        try:
+            if embedding_cache:
+                hashes = [DiskEmbeddingCache.text_hash(text) for text in texts]
+                try:
+                    cached = embedding_cache.get_many(model_name, hashes)
+                except sqlite3.Error as e:
+                    logger.warning(f"Embedding cache lookup failed, embedding all texts: {e}")
+                    cached = {}
+                for i, text_hash in enumerate(hashes):
+                    all_embeddings[i] = cached.get(text_hash)
+                logger.info(f"Embedding cache hits: {len(cached)}/{len(set(hashes))} distinct texts")
+            missing_indices = [i for i, embedding in enumerate(all_embeddings) if embedding is None]
+            
+            # Process documents in batches of similar length
+            # Use the specified batch size, respecting potential model limits (e.g., 250 for gecko)
+            effective_batch_size = min(batch_size, 250) 
+            logger.info(f"Using effective batch size of {effective_batch_size} for Vertex AI embedding")
+            batches = length_bucketed_batches(texts, missing_indices, effective_batch_size)
+            
+            if batches:
+                with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(batches))) as executor:
+                    futures = {
+                        executor.submit(_embed_batch_with_retry, embedding_model, [texts[index] for index in batch]): batch
+                        for batch in batches
+                    }
+                    # Results are collected on this thread, which also owns the cache connection
+                    for completed, future in enumerate(as_completed(futures), start=1):
+                        batch = futures[future]
+                        batch_embeddings = future.result()
+                        logger.info(f"Embedded batch {completed}/{len(batches)} ({len(batch)} texts)")
+                        # Write results back at their original positions to preserve document order
+                        for index, embedding in zip(batch, batch_embeddings):
+                            all_embeddings[index] = embedding
+                        if embedding_cache:
+                            try:
+                                embedding_cache.put_many(model_name, [
+                                    (hashes[index], embedding) for index, embedding in zip(batch, batch_embeddings)
+                                ])
+                            except sqlite3.Error as e:
+                                logger.warning(f"Could not store embeddings in the cache, continuing uncached: {e}")
+                                embedding_cache.close()
+                                embedding_cache = None
+        finally:
+            if embedding_cache:
+                embedding_cache.close()
         
         # Create embedding document objects with metadata and vectors
         embedded_documents = []
@@ -142,7 +320,8 @@ def embed_documents(
             embedded_doc = {
                 "text": doc.page_content,
                 "metadata": metadata,
-                "embedding": embedding # Embedding is already a list of floats
+                # float32 arrays take a fraction of the memory of lists of Python floats
+                "embedding": np.asarray(embedding, dtype=np.float32)
             }
             embedded_documents.append(embedded_doc)
         
@@ -163,6 +342,8 @@ def main():
                         help='Vertex AI Embedding model to use')
     parser.add_argument('--batch-size', type=int, default=250, 
                         help='Batch size for embedding generation (max typically 250 for Vertex)')
+    parser.add_argument('--quantize', default='none', choices=QUANTIZATION_MODES,
+                        help='Encoding of embeddings in the output file (int8/fp16 are smaller, slightly lossy)')
     
     args = parser.parse_args()
     
@@ -179,9 +360,7 @@ def main():
         
         # Save to output file if specified
         if args.output:
-            # Embeddings from VertexAIEmbeddings are already lists, no conversion needed
-            with open(args.output, 'w', encoding='utf-8') as f:
-                json.dump(embedded_docs, f, ensure_ascii=False, indent=2)
+            write_records(args.output, quantize_documents(embedded_docs, args.quantize))
             
             logger.info(f"Saved {len(embedded_docs)} embedded documents to {args.output}")
         
@@ -1,9 +1,11 @@
 import os
 import logging
 import argparse
+import sys
 from typing import Dict, List, Any, Optional
 import mimetypes
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 from langchain_community.document_loaders import (
     PyMuPDFLoader,
@@ -20,13 +22,44 @@ from langchain_community.document_loaders import (
 from langchain.schema.document import Document
 from google.cloud import storage
 
+# Shared JSON / JSON Lines step-output helpers (the project root isn't on sys.path when a step runs as a script)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+from processing.jsonl_io import write_records
+
+try:
+    import pypdfium2 # Optional: faster PDF text extraction than PyMuPDFLoader's per-page Documents
+except ImportError:
+    pypdfium2 = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class PdfiumLoader:
+    """Loads a PDF with pypdfium2 as a single Document (pages joined by blank lines)."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def load(self) -> List[Document]:
+        pdf = pypdfium2.PdfDocument(self.file_path)
+        try:
+            page_texts = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                page_texts.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            return [Document(page_content="\n\n".join(page_texts),
+                             metadata={"source": self.file_path, "total_pages": len(page_texts)})]
+        finally:
+            pdf.close()
+
 # Mapping of file extensions to their respective loaders
 LOADER_MAPPING = {
-    '.pdf': PyMuPDFLoader,
+    '.pdf': PdfiumLoader if pypdfium2 else PyMuPDFLoader,
     '.txt': TextLoader,
     '.doc': Docx2txtLoader,
     '.docx': Docx2txtLoader,
@@ -42,6 +75,10 @@ LOADER_MAPPING = {
     '.json': UnstructuredFileLoader,
 }
 
+# Loaders are CPU-bound (PDF decoding, Office XML parsing), so directory extraction spreads files
+# across processes. Defaults to one worker per CPU.
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+
 def get_file_extension(file_path: str) -> str:
     """Get the file extension from a file path."""
     _, ext = os.path.splitext(file_path.lower())
@@ -90,6 +127,14 @@ def extract_text_from_file(file_path: str) -> List[Dict[str, Any]]:
         logger.error(f"Error extracting text from {file_path}: {str(e)}")
         raise
 
+def _extract_text_or_skip(file_path: str) -> List[Document]:
+    """extract_text_from_file for directory runs: a file that fails is logged and skipped."""
+    try:
+        return extract_text_from_file(file_path)
+    except Exception as e:
+        logger.warning(f"Skipping file {file_path} due to error: {str(e)}")
+        return []
+
 def extract_text_from_directory(directory_path: str, recursive: bool = True) -> List[Dict[str, Any]]:
     """
     Extract text from all supported files in a directory.
@@ -100,23 +145,29 @@ def extract_text_from_directory(directory_path: str, recursive: bool = True) ->
         raise FileNotFoundError(f"Directory not found: {directory_path}")
     
     all_documents = []
-     
+    
+    # Collect the supported files first, then extract them in parallel
+    file_paths = []
     for root, dirs, files in os.walk(directory_path):
         for file in files:
             file_path = os.path.join(root, file)
-            ext = get_file_extension(file_path)
-            
-            if ext in LOADER_MAPPING:
-                try:
-                    docs = extract_text_from_file(file_path)
-                    all_documents.extend(docs)
-                except Exception as e:
-                    logger.warning(f"Skipping file {file_path} due to error: {str(e)}")
+            if get_file_extension(file_path) in LOADER_MAPPING:
+                file_paths.append(file_path)
         
         # If not recursive, don't process subdirectories
         if not recursive:
             break
     
+    workers = min(EXTRACT_WORKERS, len(file_paths))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # chunksize=1: files vary a lot in cost, so hand them out one at a time
+            for docs in pool.map(_extract_text_or_skip, file_paths):
+                all_documents.extend(docs)
+    else:
+        for file_path in file_paths:
+            all_documents.extend(_extract_text_or_skip(file_path))
+    
     logger.info(f"Extracted {len(all_documents)} document(s) from directory: {directory_path}")
     return all_documents
 
@@ -199,13 +250,8 @@ def main():
         
         # Save to output file if specified
         if args.output:
-            import json
-            
             # Convert documents to serializable format
-            serializable_docs = [{"text": doc.page_content, "metadata": doc.metadata} for doc in documents]
-            
-            with open(args.output, 'w', encoding='utf-8') as f:
-                json.dump(serializable_docs, f, ensure_ascii=False, indent=2)
+            write_records(args.output, ({"text": doc.page_content, "metadata": doc.metadata} for doc in documents))
             
             logger.info(f"Saved documents to {args.output}")
         
@@ -0,0 +1,48 @@
+"""
+Reading and writing of the pipeline's intermediate document files.
+
+A .jsonl path holds one JSON object per line and is streamed in both directions; any other
+path holds a single JSON array. Every step (and its CLI) goes through these two functions so
+the files they exchange always share one format.
+"""
+import json
+
+try:
+    import orjson # Optional: much faster (de)serialization, including numpy embeddings
+except ImportError:
+    orjson = None
+
+def _json_default(value):
+    """json.dumps fallback for numpy values (embeddings) when orjson isn't installed."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def read_records(file_path: str):
+    """Yields records from a JSON Lines file (one object per line) or from a JSON array file."""
+    if file_path.endswith(".jsonl"):
+        loads = orjson.loads if orjson else json.loads
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield loads(line)
+    else:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+def write_records(file_path: str, records):
+    """
+    Writes records (any iterable of dicts). A .jsonl path is written one record per line, so the
+    serialized output never has to exist in memory as a whole; any other path gets a JSON array.
+    """
+    if file_path.endswith(".jsonl"):
+        with open(file_path, 'wb') as f:
+            for record in records:
+                if orjson:
+                    f.write(orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS))
+                else:
+                    f.write(json.dumps(record, ensure_ascii=False, default=_json_default).encode('utf-8'))
+                f.write(b"\n")
+    else:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(list(records), f, ensure_ascii=False, indent=2, default=_json_default)
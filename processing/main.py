@@ -6,11 +6,18 @@ import importlib
 import yaml
 import json
 import shutil
+import signal
 from typing import Dict, Any, List, Optional
 import uuid
 import tempfile
 from dotenv import load_dotenv
 
+# Shared JSON / JSON Lines step-output helpers (this file may run as a script from its own directory)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+from processing.jsonl_io import write_records
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -382,22 +389,12 @@ def run_workflow(config: Dict[str, Any], cli_args: Dict[str, Any]):
                 try:
                     if step_name in ["extract_text", "chunk_text"] and isinstance(result, list):
                          # Langchain Document objects
-                        serializable_docs = [{"text": doc.page_content, "metadata": doc.metadata} for doc in result]
-                        with open(output_file, 'w', encoding='utf-8') as f:
-                            json.dump(serializable_docs, f, ensure_ascii=False, indent=2)
+                        write_records(output_file, ({"text": doc.page_content, "metadata": doc.metadata} for doc in result))
                     elif step_name == "embed_text" and isinstance(result, list):
-                         # List of dicts with numpy arrays
-                        serializable_docs = []
-                        for doc in result:
-                             embedding = doc["embedding"]
-                             serializable_doc = {
-                                "text": doc["text"],
-                                "metadata": doc["metadata"],
-                                "embedding": embedding.tolist() if hasattr(embedding, "tolist") else embedding
-                             }
-                             serializable_docs.append(serializable_doc)
-                        with open(output_file, 'w', encoding='utf-8') as f:
-                             json.dump(serializable_docs, f, ensure_ascii=False, indent=2)
+                         # List of dicts with numpy float32 embeddings, optionally quantized on disk
+                        quantize_documents = import_function(module_path, "quantize_documents")
+                        quantization = resolve_variable(step.get("quantize", "none"), context)
+                        write_records(output_file, quantize_documents(result, quantization))
                     # Add other result types if needed
                     else:
                          # Try generic JSON dump for other types (like store_data count)
@@ -441,6 +438,64 @@ def run_workflow(config: Dict[str, Any], cli_args: Dict[str, Any]):
     
     logger.info("Workflow finished.")
 
+def run(workspace_id: str, file_path: str, overrides: Optional[Dict[str, Any]] = None,
+        config_file: str = 'workflow.yaml'):
+    """
+    Process a single local file in-process, the same way `main.py --input-type local_file` would.
+    Lets a long-lived caller (e.g. the backend's worker pool) reuse already-imported modules
+    instead of starting a new interpreter per file. Raises on failure.
+
+    Args:
+        workspace_id: Workspace the document belongs to.
+        file_path: Path to the local file to process.
+        overrides: Optional default overrides (chunking_method, chunk_size, chunk_overlap, embedding_model).
+        config_file: Workflow configuration file name, relative to this directory.
+    """
+    processing_dir = os.path.dirname(os.path.abspath(__file__))
+    config = load_workflow_config(os.path.join(processing_dir, config_file))
+    # Relative output paths are resolved against this directory, as when run as a script from here
+    defaults = config.setdefault("defaults", {})
+    base = defaults.get("local_processing_base") or "./local_processing_output"
+    if not os.path.isabs(base):
+        base = os.path.join(processing_dir, base)
+    # Each file gets its own (stable) output directory: the intermediate file paths otherwise only
+    # depend on the workspace, so concurrent runs for one workspace would overwrite each other's files.
+    # Re-processing the same file overwrites its previous outputs, so the directory doesn't grow per run.
+    run_dir = os.path.join(base, "files", os.path.basename(file_path))
+    defaults["local_processing_base"] = run_dir
+
+    cli_args = {k: v for k, v in (overrides or {}).items() if v is not None}
+    cli_args.update({'workspace_id': workspace_id, 'input_type': 'local_file', 'file_path': file_path})
+    try:
+        run_workflow(config, cli_args)
+    finally:
+        try:
+            os.rmdir(run_dir) # Only succeeds if cleanup left it empty
+        except OSError:
+            pass
+
+def run_with_timeout(timeout_seconds: float, workspace_id: str, file_path: str,
+                     overrides: Optional[Dict[str, Any]] = None):
+    """
+    run() with a time limit that starts when the job actually starts running in this process,
+    not when it was queued. On timeout the job is interrupted and TimeoutError is raised.
+    Must be called from the process's main thread (as pool workers do). Platforms without
+    SIGALRM (Windows) run without a limit.
+    """
+    if not hasattr(signal, "setitimer"):
+        return run(workspace_id, file_path, overrides)
+
+    def _on_timeout(signum, frame):
+        raise TimeoutError(f"Processing {os.path.basename(file_path)} exceeded {timeout_seconds}s")
+
+    previous_handler = signal.signal(signal.SIGALRM, _on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+    try:
+        return run(workspace_id, file_path, overrides)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
 def main():
     """Main entry point for the workflow runner."""
     parser = argparse.ArgumentParser(description='Run RAG processing workflow')
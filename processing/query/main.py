@@ -8,6 +8,7 @@ import datetime
 import sys
 import time
 import asyncio
+import functools
 
 import psycopg2
 import numpy as np
@@ -60,6 +61,18 @@ except ImportError as e:
         model_config = EMBEDDING_MODELS[model_name]
         return model_config["class"](**model_config["params"])
 
+# Model clients are expensive to build (credential lookup, gRPC/HTTPS channel setup) and safe to
+# share, so keep one per configuration for the life of the process instead of one per query.
+@functools.lru_cache(maxsize=8)
+def get_shared_embedding_model(model_name: str):
+    """Process-wide cached instance of get_embedding_model(model_name)."""
+    return get_embedding_model(model_name)
+
+@functools.lru_cache(maxsize=16)
+def _get_vertex_llm(model_name: str, temperature: float, streaming: bool):
+    """Process-wide cached VertexAI LLM client for one (model, temperature, streaming) combination."""
+    return VertexAI(model_name=model_name, temperature=temperature, streaming=streaming)
+
 # Custom retriever for PostgreSQL/pgvector database
 class PgVectorRetriever(BaseRetriever, BaseModel):
     """Retriever for PostgreSQL with pgvector."""
@@ -70,6 +83,7 @@ class PgVectorRetriever(BaseRetriever, BaseModel):
     table_prefix: str = Field("", description="Optional prefix for database tables")
     search_type: str = Field("cosine", description="Vector search type (cosine, l2, inner)")
     top_k: int = Field(4, description="Number of documents to retrieve")
+    user_id: Optional[str] = Field(None, description="If set, only return chunks if this user can access the workspace")
     
     # Private attributes (not fields)
     _embedding_model = None
@@ -79,7 +93,7 @@ class PgVectorRetriever(BaseRetriever, BaseModel):
         """Lazy load the embedding model."""
         if self._embedding_model is None:
             logger.info(f"Loading embedding model for retriever: {self.embedding_model_name}")
-            self._embedding_model = get_embedding_model(self.embedding_model_name)
+            self._embedding_model = get_shared_embedding_model(self.embedding_model_name)
         return self._embedding_model
     
     def get_relevant_documents(self, query: str) -> List[Document]:
@@ -121,6 +135,7 @@ class PgVectorRetriever(BaseRetriever, BaseModel):
                         {documents_table} d ON c.doc_id = d.doc_id
                     WHERE 
                         d.workspace_id = %s
+                        {{access_guard}}
                     ORDER BY 
                         similarity ASC -- ASC for distance, DESC for inner product
                     LIMIT %s;
@@ -132,12 +147,32 @@ class PgVectorRetriever(BaseRetriever, BaseModel):
                 # Convert embedding list to string format for query
                 query_embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
                 
-                cur.execute(query_sql, (query_embedding_str, self.workspace_id, self.top_k))
-                results = cur.fetchall()
+                params = [query_embedding_str, self.workspace_id]
+                if self.user_id:
+                    # Re-check access in the same statement as the search, so access revoked after the
+                    # caller's (possibly cached) check can't leak chunks. Same rule as the backend:
+                    # workspace not marked for deletion, and the user is its owner or a member of a
+                    # group granted access to it.
+                    query_sql = query_sql.replace("{access_guard}", """AND EXISTS (
+                            SELECT 1 FROM workspaces w
+                            WHERE w.workspace_id = d.workspace_id
+                              AND NOT EXISTS (SELECT 1 FROM workspaces_pending_deletion p WHERE p.workspace_id = w.workspace_id)
+                              AND (w.owner_user_id = %s OR EXISTS (
+                                  SELECT 1
+                                  FROM workspace_group_access wga
+                                  JOIN user_group_memberships ugm ON ugm.group_id = wga.group_id
+                                  WHERE wga.workspace_id = w.workspace_id AND ugm.user_id = %s))
+                        )""")
+                    params.extend([self.user_id, self.user_id])
+                else:
+                    query_sql = query_sql.replace("{access_guard}", "")
+                params.append(self.top_k)
+                
+                cur.execute(query_sql, params)
                 
-                # Create Document objects
+                # Create Document objects straight from the cursor (no intermediate fetchall list)
                 documents = []
-                for row in results:
+                for row in cur:
                     chunk_text, doc_meta_json, file_name, chunk_index, page_number, similarity = row
                     
                     # Parse JSON metadata safely
@@ -198,14 +233,14 @@ def get_llm(model_name: Optional[str] = None, temperature: float = 0.6, streamin
     logger.info(f"Using Vertex AI model: {effective_model_name} (Source: {source}, Streaming: {streaming}, Temp: {temperature})")
     
     try:
-        return VertexAI(model_name=effective_model_name, temperature=temperature, streaming=streaming)
+        return _get_vertex_llm(effective_model_name, temperature, streaming)
     except Exception as e:
          logger.error(f"Failed to initialize Vertex AI model '{effective_model_name}': {e}", exc_info=True)
          # Optional: try the ultimate fallback if the selected one failed?
          if effective_model_name != fallback_model_name:
               logger.warning(f"Attempting to use fallback model {fallback_model_name} due to error.")
               try:
-                   return VertexAI(model_name=fallback_model_name, temperature=temperature, streaming=streaming)
+                   return _get_vertex_llm(fallback_model_name, temperature, streaming)
               except Exception as fallback_e:
                    logger.error(f"Fallback model {fallback_model_name} also failed: {fallback_e}", exc_info=True)
                    raise fallback_e # Re-raise the error from the fallback
@@ -363,7 +398,8 @@ async def process_query_stream(
     top_k: int = 4,
     temperature: float = 0.2,
     chat_history: Optional[List[Dict[str, Any]]] = None,
-    collect_metadata: bool = False  # Add parameter to control metadata collection
+    collect_metadata: bool = False,  # Add parameter to control metadata collection
+    user_id: Optional[str] = None
 ):
     """
     Process a query against document chunks stored in PostgreSQL with pgvector, streaming the response.
@@ -380,6 +416,7 @@ async def process_query_stream(
         temperature: Temperature for text generation.
         chat_history: Previous conversation messages.
         collect_metadata: Whether to collect and return metadata for debugging.
+        user_id: If given, retrieval only returns chunks when this user can access the workspace.
         
     Returns:
         Async generator yielding response text chunks and optionally metadata.
@@ -396,7 +433,8 @@ async def process_query_stream(
             workspace_id=workspace_id,
             table_prefix=table_prefix,
             search_type=search_type,
-            top_k=top_k
+            top_k=top_k,
+            user_id=user_id
         )
         
         # Create streaming chain
@@ -408,8 +446,11 @@ async def process_query_stream(
         
         # Start processing
         retrieval_start = time.time()
-        # Get relevant docs first (we need them for debug info even if they get processed internally)
-        relevant_docs = retriever.get_relevant_documents(query)
+        # Get relevant docs first (we need them for debug info even if they get processed internally).
+        # Retrieval is blocking (embedding call + psycopg2), so run it on the executor rather than
+        # stalling the event loop that's serving every other stream; the chain itself streams natively.
+        loop = asyncio.get_running_loop()
+        relevant_docs = await loop.run_in_executor(None, retriever.get_relevant_documents, query)
         retrieval_end = time.time()
         
         # Build metadata about retrieved documents if collecting
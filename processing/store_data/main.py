@@ -6,31 +6,47 @@ import uuid
 import sys  # Make sure sys is imported for sys.exit()
 from typing import List, Dict, Any, Optional, Union
 import datetime
+import base64
 
 import psycopg2
 from psycopg2.extras import execute_batch
 import numpy as np
 
+# Shared JSON / JSON Lines step-output helpers (the project root isn't on sys.path when a step runs as a script)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+from processing.jsonl_io import read_records
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def dequantize_embedding(encoded: str, dtype: str, scale: Optional[float] = None) -> np.ndarray:
+    """Decodes an int8/float16 embedding written by embed_text (--quantize) back to float32."""
+    vector = np.frombuffer(base64.b64decode(encoded), dtype=np.dtype(dtype)).astype(np.float32)
+    if scale is not None:
+        vector *= scale
+    return vector
+
 def load_embedded_documents_from_json(file_path: str) -> List[Dict[str, Any]]:
     """
-    Load embedded documents from a JSON file in the format produced by the embed_text module.
+    Load embedded documents from a JSON or JSON Lines file in the format produced by the embed_text module.
     """
     if not os.path.exists(file_path):
         logger.error(f"File not found: {file_path}")
         raise FileNotFoundError(f"File not found: {file_path}")
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Convert embedding lists back to numpy arrays if needed
-        for doc in data:
-            if isinstance(doc["embedding"], list):
+        data = []
+        for doc in read_records(file_path):
+            # Convert quantized payloads / embedding lists back to float32 numpy arrays
+            if "embedding_q" in doc:
+                doc["embedding"] = dequantize_embedding(doc.pop("embedding_q"), doc.pop("embedding_dtype"),
+                                                        doc.pop("embedding_scale", None))
+            elif isinstance(doc["embedding"], list):
                 doc["embedding"] = np.array(doc["embedding"], dtype=np.float32)
+            data.append(doc)
         
         logger.info(f"Loaded {len(data)} embedded documents from {file_path}")
         return data